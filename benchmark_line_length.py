@@ -0,0 +1,442 @@
+# Written using Python 3.7.3
+""" Benchmarks for `reformat_line_length`.
+
+Generates reproducible corpora (prose, bullet lists, hyphen- and slash-heavy
+text, very long single lines and text with many empty lines), runs
+`reformatter` over them at several sizes and line lengths, and reports the
+throughput, the latency per input line, the peak memory and how these scale
+with the input size, optionally for several wrap modes. Before that,
+known-answer cases make sure the output has not changed.
+\\
+The results can be saved as JSON and compared against the results of an
+earlier run, in which case the benchmark fails if the throughput of any case
+drops by more than a given threshold. With `--tokenizer` the compiled
+tokenizer is compared with the per-character reference tokenizer instead.
+"""
+
+import argparse
+import glob
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+
+import reformat_line_length as rll
+
+
+BREAKCHARS = ['-', '/']
+
+## known-answer cases: (input, parameters, expected output)
+KNOWN_ANSWERS = [
+    ("The quick brown fox jumps over the lazy dog.\n", {'ncol': 20},
+     "The quick brown fox\njumps over the lazy\ndog."),
+    ("A first line that was wrapped\nby hand at some point.\n\n"
+     "A second paragraph.\n", {'ncol': 16},
+     "A first line\nthat was wrapped\nby hand at some\npoint.\n\nA second\n"
+     "paragraph."),
+    ("Items:\n- first item\n- second item that is long\n* third\n",
+     {'ncol': 12},
+     "Items:\n- first item\n- second\nitem that is\nlong\n* third"),
+    ("well-known client/server set-up\n", {'ncol': 10},
+     "well-known\nclient/\nserver\nset-up"),
+    ("one\n\n\ntwo\n", {'ncol': 10, 'preserve_empty_lines': False},
+     "one\ntwo"),
+    ("short\nlines\nare\njoined\n", {'ncol': 30, 'preserve_breaks': False},
+     "short lines are joined"),
+    ("a supercalifragilistic word\n", {'ncol': 8},
+     "a\nsupercalifragilistic\nword"),
+    ("supercalifragilistic and more\n", {'ncol': 8},
+     "\nsupercalifragilistic\nand more"),
+    ("  indented\ntext here\n", {'ncol': 30},
+     "  indented\ntext here"),
+    ("no trailing newline", {},
+     "no trailing newline"),
+    ("aaa bb cc ddddd\n", {'ncol': 6, 'wrap_mode': 'optimal'},
+     "aaa\nbb cc\nddddd"),
+    ("well-known client/server set-up\n",
+     {'ncol': 10, 'wrap_mode': 'optimal'},
+     "well-known\nclient/\nserver\nset-up"),
+    ("supercalifragilistic and more\n", {'ncol': 8, 'wrap_mode': 'optimal'},
+     "supercalifragilistic\nand more"),
+    # wide CJK characters take two columns each
+    ("\u6f22\u5b57 \u304b\u306a \u30ab\u30ca \u30c6\u30b9\u30c8\n",
+     {'ncol': 10, 'width_mode': 'display'},
+     "\u6f22\u5b57 \u304b\u306a\n\u30ab\u30ca\n\u30c6\u30b9\u30c8"),
+    # a combining accent takes no column
+    ("cafe\u0301 cafe\u0301 cafe\u0301\n",
+     {'ncol': 10, 'width_mode': 'display'},
+     "cafe\u0301 cafe\u0301\ncafe\u0301"),
+]
+
+## corpus generators
+WORDS = ("lorem ipsum dolor sit amet consectetur adipiscing elit sed do "
+         "eiusmod tempor incididunt ut labore et dolore magna aliqua enim ad "
+         "minim veniam quis nostrud exercitation ullamco laboris nisi aliquip "
+         "ex ea commodo consequat").split()
+
+def _sentence(rng, n_words: int) -> str:
+    """ Create a sentence of `n_words` random words. """
+    words = [rng.choice(WORDS) for _ in range(n_words)]
+    return ' '.join(words).capitalize() + '.'
+
+def _prose(rng) -> str:
+    """ Paragraphs of sentences, wrapped by hand at about 70 columns. """
+    text = ' '.join(_sentence(rng, rng.randint(4, 20))
+                    for _ in range(rng.randint(2, 8)))
+    lines, line = [], ''
+    for word in text.split(' '):
+        if line and len(line)+len(word) >= 70:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    lines.append(line)
+    return '\n'.join(lines) + '\n\n'
+
+def _bullets(rng) -> str:
+    """ A heading followed by a (nested) list that uses the startchars. """
+    lines = [_sentence(rng, rng.randint(2, 6))[:-1] + ':']
+    for _ in range(rng.randint(3, 10)):
+        bullet = rng.choice(['- ', '* ', '> ', '  - ', '\t* '])
+        lines.append(bullet + _sentence(rng, rng.randint(3, 25)))
+    return '\n'.join(lines) + '\n\n'
+
+def _breakchars(rng) -> str:
+    """ Text full of hyphenated words and paths. """
+    words = []
+    for _ in range(rng.randint(20, 80)):
+        kind = rng.random()
+        if kind < 0.3:
+            words.append('-'.join(rng.choice(WORDS)
+                                  for _ in range(rng.randint(2, 4))))
+        elif kind < 0.6:
+            words.append('/' + '/'.join(rng.choice(WORDS)
+                                        for _ in range(rng.randint(2, 6))))
+        else:
+            words.append(rng.choice(WORDS))
+    return ' '.join(words) + '\n'
+
+def _long_lines(rng) -> str:
+    """ A single line of about 100k characters. """
+    return _sentence(rng, 16000) + '\n'
+
+def _empty_lines(rng) -> str:
+    """ Short lines separated by runs of empty lines. """
+    return _sentence(rng, rng.randint(1, 6)) + '\n' * rng.randint(1, 6)
+
+CORPORA = {
+    'prose': _prose,
+    'bullets': _bullets,
+    'breakchars': _breakchars,
+    'long_lines': _long_lines,
+    'empty_lines': _empty_lines,
+}
+
+def make_corpus(kind: str, size: int, seed: int = 0) -> str:
+    """ Create a reproducible corpus of `kind` with at least `size` chars. """
+    rng = random.Random(f"{kind}-{seed}")
+    parts, n = [], 0
+    while n < size:
+        parts.append(CORPORA[kind](rng))
+        n += len(parts[-1])
+    return ''.join(parts)
+
+## checks and measurements
+def _reformat_file(path: str, **kwargs) -> tuple:
+    """ Run `reformatter` once, remove the new file and return its contents.
+
+    Returns a tuple of the new file's contents and the run time in seconds.
+    """
+    pattern = os.path.splitext(path)[0] + '_*'
+    start = time.perf_counter()
+    rll.reformatter(path, **kwargs)
+    seconds = time.perf_counter() - start
+    output = ''
+    for new_path in glob.glob(pattern):
+        with open(new_path, 'r') as infile:
+            output = infile.read()
+        os.remove(new_path)
+    return output, seconds
+
+def check_known_answers() -> list:
+    """ Reformat all known-answer cases, in memory and as files.
+
+    Returns a list of descriptions of all cases with an unexpected output.
+    """
+    failures = []
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'case.txt')
+        for n, (text, kwargs, expected) in enumerate(KNOWN_ANSWERS):
+            outputs = {'reformat_text': rll.reformat_text(text, **kwargs)}
+            with open(path, 'w') as outfile:
+                outfile.write(text)
+            outputs['reformatter'] = _reformat_file(path, **kwargs)[0]
+            for func, output in outputs.items():
+                if not output == expected:
+                    failures.append(f"case {n} ({func}): expected "
+                                    f"{expected!r}, got {output!r}")
+    finally:
+        shutil.rmtree(tmpdir)
+    return failures
+
+def bench_case(
+        path: str, ncol: int, repeat: int = 3, wrap_mode: str = 'greedy'
+        ) -> dict:
+    """ Measure `reformatter` on one file.
+
+    Returns the best run time in seconds and the peak memory in bytes that is
+    allocated by Python (measured in a separate run, as tracing is slow).
+    """
+    seconds = min(_reformat_file(path, ncol=ncol, wrap_mode=wrap_mode)[1]
+                  for _ in range(repeat))
+    tracemalloc.start()
+    try:
+        _reformat_file(path, ncol=ncol, wrap_mode=wrap_mode)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'seconds': seconds, 'peak_bytes': peak}
+
+def _slope(xs: list, ys: list) -> float:
+    """ Slope of a least squares fit of log(ys) over log(xs).
+
+    A slope of 1 means that the values grow linearly with the input size.
+    """
+    points = [(math.log(x), math.log(y)) for x, y in zip(xs, ys)
+              if x > 0 and y > 0]
+    if len(points) < 2:
+        return None
+    mx = sum(x for x, _ in points) / len(points)
+    my = sum(y for _, y in points) / len(points)
+    var = sum((x-mx)**2 for x, _ in points)
+    if not var:
+        return None
+    return sum((x-mx)*(y-my) for x, y in points) / var
+
+def run_suite(
+        kinds: list, sizes: list, ncols: list, repeat: int = 3,
+        verbose: bool = True, wrap_modes: list = ['greedy']
+        ) -> dict:
+    """ Run `reformatter` for each combination of corpus, size, ncol and wrap
+    mode.
+
+    `sizes` are given in MB. Returns a dict with the metadata of the run, one
+    entry per case and the scaling exponents of run time and peak memory with
+    respect to the input size for each corpus, ncol and wrap mode.
+    """
+    results = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'cases': [],
+        'scaling': [],
+    }
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'corpus.txt')
+        for kind in kinds:
+            for size_mb in sizes:
+                text = make_corpus(kind, int(size_mb * 1e6))
+                with open(path, 'w') as outfile:
+                    outfile.write(text)
+                n_bytes = os.path.getsize(path)
+                n_lines = text.count('\n') + 1
+                del text
+                for ncol in ncols:
+                    for wrap_mode in wrap_modes:
+                        case = bench_case(path, ncol, repeat, wrap_mode)
+                        case.update({
+                            'corpus': kind, 'size_mb': size_mb, 'ncol': ncol,
+                            'wrap_mode': wrap_mode, 'bytes': n_bytes,
+                            'lines': n_lines,
+                            'mb_per_s': n_bytes / 1e6 / case['seconds'],
+                            'us_per_line': case['seconds'] / n_lines * 1e6,
+                        })
+                        results['cases'].append(case)
+                        if verbose:
+                            _print_case(case)
+    finally:
+        shutil.rmtree(tmpdir)
+
+    for kind in kinds:
+        for ncol in ncols:
+            for wrap_mode in wrap_modes:
+                cases = [c for c in results['cases']
+                         if c['corpus'] == kind and c['ncol'] == ncol
+                         and c['wrap_mode'] == wrap_mode]
+                n_bytes = [c['bytes'] for c in cases]
+                results['scaling'].append({
+                    'corpus': kind, 'ncol': ncol, 'wrap_mode': wrap_mode,
+                    'time_exponent': _slope(n_bytes,
+                                            [c['seconds'] for c in cases]),
+                    'memory_exponent': _slope(
+                        n_bytes, [c['peak_bytes'] for c in cases]),
+                })
+    return results
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """ Compare the throughput of all cases with an earlier run.
+
+    Returns a description of each case whose throughput dropped by more than
+    the fraction `threshold` compared to the same case of `baseline`.
+    """
+    def key(case): # results from before wrap modes are all greedy
+        return (case['corpus'], case['size_mb'], case['ncol'],
+                case.get('wrap_mode', 'greedy'))
+    previous = {key(case): case for case in baseline['cases']}
+    regressions = []
+    for case in results['cases']:
+        old = previous.get(key(case))
+        if old is None:
+            continue
+        if case['mb_per_s'] < old['mb_per_s'] * (1-threshold):
+            regressions.append(
+                f"{case['corpus']}, {case['size_mb']:g} MB, ncol "
+                f"{case['ncol']}, {case['wrap_mode']}: "
+                f"{case['mb_per_s']:.2f} MB/s (baseline: "
+                f"{old['mb_per_s']:.2f} MB/s)")
+    return regressions
+
+def _print_case(case: dict):
+    """ Print one line of the results table. """
+    print(f"{case['corpus']:<12}{case['size_mb']:>8g}{case['ncol']:>6}"
+          f"{case['wrap_mode']:>9}"
+          f"{case['mb_per_s']:>10.2f}{case['us_per_line']:>12.2f}"
+          f"{case['peak_bytes']/1e6:>10.1f}")
+
+## tokenizer comparison
+def make_line(n_chars: int, break_ratio: float, seed: int = 0) -> str:
+    """ Create a reproducible line of about `n_chars` characters.
+
+    `break_ratio` is the share of separators (whitespaces and breakchars)
+    among all characters of the line.
+    """
+    rng = random.Random(seed)
+    chars = []
+    for _ in range(n_chars):
+        if rng.random() < break_ratio:
+            chars.append(rng.choice([' '] + BREAKCHARS))
+        else:
+            chars.append(rng.choice('abcdefghijklmnopqrstuvwxyz'))
+    return ''.join(chars) + '\n'
+
+def bench_tokenizer(line: str, repeat: int = 5) -> tuple:
+    """ Time both tokenizers on one line.
+
+    Returns the best time per call in seconds for the per-character reference
+    and for the compiled tokenizer.
+    """
+    if not (rll._tokenize_line_chars(line, BREAKCHARS)
+            == rll._tokenize_line(line, BREAKCHARS)):
+        raise AssertionError("tokenizers do not match")
+    tokenize = rll._compile_tokenizer(tuple(BREAKCHARS))
+    number = max(1, 200000 // len(line))
+    t_chars = min(timeit.repeat(
+        lambda: rll._tokenize_line_chars(line, BREAKCHARS),
+        number=number, repeat=repeat)) / number
+    t_compiled = min(timeit.repeat(
+        lambda: tokenize(line), number=number, repeat=repeat)) / number
+    return t_chars, t_compiled
+
+def run_tokenizer(repeat: int = 5):
+    """ Print the comparison of both tokenizers. """
+    cases = [
+        ("prose, 80 chars", make_line(80, 0.17)),
+        ("prose, 10k chars", make_line(10000, 0.17)),
+        ("prose, 1M chars", make_line(1000000, 0.17)),
+        ("break-heavy, 10k chars", make_line(10000, 0.6)),
+        ("break-heavy, 1M chars", make_line(1000000, 0.6)),
+    ]
+    print(f"{'case':<24}{'per-char':>12}{'compiled':>12}{'speedup':>10}")
+    for name, line in cases:
+        t_chars, t_compiled = bench_tokenizer(line, repeat)
+        print(f"{name:<24}{t_chars*1e6:>10.1f}us{t_compiled*1e6:>10.1f}us"
+              f"{t_chars/t_compiled:>9.1f}x")
+
+def _fmt(value, digits: int = 2) -> str:
+    """ Round a number for printing, keeping `None` as is. """
+    return str(value) if value is None else f"{value:.{digits}f}"
+
+def main():
+    """ main (module wrapper) """
+    parser = argparse.ArgumentParser(
+        description="Benchmark reformat_line_length."
+    )
+    parser.add_argument("--corpora", type=str, nargs="+",
+                        default=list(CORPORA), choices=list(CORPORA),
+                        help="corpora to run; default: all")
+    parser.add_argument("--sizes", type=float, nargs="+",
+                        default=[0.25, 1.0],
+                        help="corpus sizes in MB; default: 0.25 1")
+    parser.add_argument("--ncols", type=int, nargs="+", default=[40, 80],
+                        help="line lengths; default: 40 80")
+    parser.add_argument("--wrap_modes", type=str, nargs="+",
+                        default=["greedy"], choices=["greedy", "optimal"],
+                        help=("wrap modes to run, e.g., both to compare "
+                              "them; default: greedy"))
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="number of repetitions per case; default: 3")
+    parser.add_argument("--output", type=str, default=None,
+                        help="save the results as JSON to this path")
+    parser.add_argument("--baseline", type=str, default=None,
+                        help=("JSON results of an earlier run to compare the "
+                              "throughput with"))
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help=("allowed drop of throughput compared to the "
+                              "baseline; default: 0.2 (i.e., 20%%)"))
+    parser.add_argument("--tokenizer", action="store_true",
+                        help=("only compare the compiled tokenizer with the "
+                              "per-character reference"))
+    args = parser.parse_args()
+
+    if args.tokenizer:
+        run_tokenizer(args.repeat)
+        return 0
+
+    failures = check_known_answers()
+    if failures:
+        print("Known-answer check failed:")
+        for failure in failures:
+            print(f" {failure}")
+        return 1
+    print(f"Known-answer check passed ({len(KNOWN_ANSWERS)} cases).\n")
+
+    print(f"{'corpus':<12}{'MB':>8}{'ncol':>6}{'mode':>9}{'MB/s':>10}"
+          f"{'us/line':>12}{'peak MB':>10}")
+    results = run_suite(args.corpora, args.sizes, args.ncols, args.repeat,
+                        wrap_modes=args.wrap_modes)
+    print(f"\n{'corpus':<12}{'ncol':>6}{'mode':>9}{'time exp.':>12}"
+          f"{'memory exp.':>14}")
+    for scaling in results['scaling']:
+        print(f"{scaling['corpus']:<12}{scaling['ncol']:>6}"
+              f"{scaling['wrap_mode']:>9}"
+              f"{_fmt(scaling['time_exponent']):>12}"
+              f"{_fmt(scaling['memory_exponent']):>14}")
+
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            json.dump(results, outfile, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as infile:
+            baseline = json.load(infile)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\nThroughput dropped by more than {args.threshold:.0%}:")
+            for regression in regressions:
+                print(f" {regression}")
+            return 1
+        print("\nNo throughput regression compared to the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
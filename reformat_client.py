@@ -0,0 +1,131 @@
+# Written using Python 3.7.3
+""" Thin client for the server mode of `reformat_line_length`.
+
+Sends files or the text from stdin to a server that was started with
+`reformat_line_length.py --serve SOCKET`, which keeps running between calls.
+Thus, neither the reformatting code nor its parameter setup is loaded for
+each call, only the few modules needed to talk to the server.
+\\
+Without any path the text from stdin is reformatted and written to stdout,
+otherwise each file is reformatted by the server, just like on the command
+line of `reformat_line_length.py`.
+"""
+
+import argparse
+import json
+import os
+import socket
+import sys
+
+
+def get_cmd_line_args():
+    """ Initiate command line arguments via `argparse`. """
+    parser = argparse.ArgumentParser(
+        description=("Reformat files or stdin to a specified line length via "
+                     "a running reformat_line_length.py server.")
+    )
+    parser.add_argument("socket", type=str,
+                        help="path to the Unix domain socket of the server")
+    parser.add_argument("paths", type=str, nargs="*", default=None,
+                        help=("paths to files which are to be reformatted; "
+                              "'-' or no path reads from stdin and writes to "
+                              "stdout"))
+    parser.add_argument("--ncol", type=int, default=None,
+                        help="new maximum line length")
+    parser.add_argument("--breakchars", type=str, nargs="*", default=None,
+                        help=("characters other than whitespaces where "
+                              "linebreaks are allowed; defaults: '-', '/'"))
+    parser.add_argument("--startchars", type=str, nargs="*", default=None,
+                        help=("characters at the start of a line that "
+                              "indicate a manual linebreak; defaults: ' ', "
+                              "'-', '*', '>', '\\t'"))
+    parser.add_argument("-b", "--ignore_manual_breaks", action="store_true",
+                        help=("avoid detection of manual linebreaks and "
+                              "preservation of these"))
+    parser.add_argument("-r", "--remove_empty_lines", action="store_true",
+                        help=("remove empty lines (whitespaces count as "
+                              "content)"))
+    parser.add_argument("--wrap_mode", type=str, default="greedy",
+                        choices=["greedy", "optimal"],
+                        help="see reformat_line_length.py; default: greedy")
+    parser.add_argument("--width_mode", type=str, default="chars",
+                        choices=["chars", "display"],
+                        help="see reformat_line_length.py; default: chars")
+    parser.add_argument("-s", "--stream", action="store_true",
+                        help=("reformat files line by line with constant "
+                              "memory usage (for very large files)"))
+    parser.add_argument("--in_place", action="store_true",
+                        help=("replace each file atomically by its new "
+                              "contents"))
+    op = parser.add_mutually_exclusive_group()
+    op.add_argument("--ping", action="store_true",
+                    help="only check whether the server is running")
+    op.add_argument("--shutdown", action="store_true",
+                    help="stop the server")
+    args = parser.parse_args()
+    if '-' in args.paths and len(args.paths) > 1:
+        parser.error("argument paths: '-' not allowed with other paths")
+    return args
+
+def request(conn, rfile, message: dict) -> dict:
+    """ Send one request to the server and return its response. """
+    conn.sendall(json.dumps(message).encode() + b'\n')
+    line = rfile.readline()
+    if not line:
+        raise ConnectionError("the server closed the connection")
+    return json.loads(line)
+
+def main():
+    """ main (module wrapper) """
+
+    args = get_cmd_line_args()
+
+    params = {'ncol': args.ncol,
+              'preserve_breaks': not args.ignore_manual_breaks,
+              'preserve_empty_lines': not args.remove_empty_lines,
+              'wrap_mode': args.wrap_mode, 'width_mode': args.width_mode}
+    if args.breakchars is not None:
+        params['breakchars'] = args.breakchars
+    if args.startchars is not None:
+        params['startchars'] = args.startchars
+
+    if args.ping or args.shutdown:
+        messages = [{'op': 'ping' if args.ping else 'shutdown'}]
+    elif args.paths in ([], ['-']):
+        messages = [dict(params, text=sys.stdin.read())]
+    else:
+        messages = []
+        for path in args.paths:
+            path = os.path.abspath(path)
+            messages.append(dict(params, path=path, stream=args.stream,
+                                 output=path if args.in_place else None))
+
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(args.socket)
+        rfile = conn.makefile('rb')
+        failed = []
+        for message in messages:
+            response = request(conn, rfile, message)
+            if not response['ok']:
+                failed.append((message.get('path', '-'), response['error']))
+            elif 'text' in response:
+                sys.stdout.write(response['text'])
+    except OSError as error:
+        print(f"Failed to reach the server on {args.socket}: "
+              f"{type(error).__name__}: {error}", file=sys.stderr)
+        return 1
+    finally:
+        conn.close()
+    if failed:
+        print(f"Failed to reformat {len(failed)} of {len(messages)} files:",
+              file=sys.stderr)
+        for path, error in failed:
+            print(f" {path}: {error}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+
+    sys.exit(main())
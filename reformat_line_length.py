@@ -11,13 +11,54 @@ If no new line length is specified, this number is set based on the longest
 line from the input file. Not specifying a line length and letting the script
 try to detect manual linebreaks essentially results in no effect, except for
 the possible removal of some trailing whitespaces.
+\\
+Besides the command line, texts can be reformatted in memory, e.g., within
+other programs, via `reformat_text`, `iter_reformat` and `reformat_batch`.
 """
 
 import os
 import argparse
+import bisect
+import collections
+import cProfile
+import difflib
+import fnmatch
+import functools
+import hashlib
+import io
+import itertools
+import json
+import locale
+import mmap
+import re
+import shutil
+import signal
+import socket
+import socketserver
+import sqlite3
+import stat
+import sys
+import tempfile
+import threading
+import time
+import unicodedata
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+try:
+    import resource
+except ImportError: # not available on Windows
+    resource = None
 # more specific imports possible, e.g., `from argparse import ArgumentParser`
 
 
+def _ncol_list(value: str) -> list:
+    """ Parse the value of `--ncol`, i.e., comma-separated line lengths. """
+    try:
+        return [int(ncol) for ncol in value.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"invalid int value: '{value}'") from None
+
 def get_cmd_line_args():
     """ Initiate command line arguments via `argparse`.
 
@@ -45,10 +86,15 @@ def get_cmd_line_args():
     parser = argparse.ArgumentParser(
         description="Reformat files to a specified line length."
     )
-    parser.add_argument("paths", type=str, nargs="+", default=None,
-                        help="paths to files which are to be reformatted")
-    parser.add_argument("--ncol", type=int, nargs="?", default=None,
-                        help="new maximum line length")
+    parser.add_argument("paths", type=str, nargs="*", default=None,
+                        help=("paths to files which are to be reformatted, or "
+                              "to directories which are searched recursively "
+                              "(needs --output_dir or --in_place); '-' or no "
+                              "path reads from stdin and writes to stdout"))
+    parser.add_argument("--ncol", type=_ncol_list, nargs="?", default=None,
+                        help=("new maximum line length; either one value for "
+                              "all files or comma-separated values, one per "
+                              "path, e.g., 80,72"))
     parser.add_argument("--breakchars", type=str, nargs="*",
                         default=['-', '/'], help=("characters other than "
                                                   "whitespaces where "
@@ -65,7 +111,138 @@ def get_cmd_line_args():
     parser.add_argument("-r", "--remove_empty_lines", action="store_true",
                         help=("remove empty lines (whitespaces count as "
                               "content)"))
-    return parser.parse_args()
+    parser.add_argument("--wrap_mode", type=str, default="greedy",
+                        choices=["greedy", "optimal"],
+                        help=("greedy: as many words per line as fit; "
+                              "optimal: lines of each paragraph as even as "
+                              "possible; default: greedy"))
+    parser.add_argument("--width_mode", type=str, default="chars",
+                        choices=["chars", "display"],
+                        help=("chars: measure lines by their number of "
+                              "characters; display: by their width on "
+                              "screen, where East Asian wide characters and "
+                              "emoji take two columns and combining "
+                              "characters none; default: chars"))
+    parser.add_argument("-s", "--stream", action="store_true",
+                        help=("reformat line by line with constant memory "
+                              "usage (for very large files)"))
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help=("number of files that are reformatted in "
+                              "parallel; 0 uses all CPUs; default: 1"))
+    parser.add_argument("--chunk_jobs", type=int, default=1,
+                        help=("number of processes that reformat chunks of "
+                              "each (large) file in parallel; 0 uses all "
+                              "CPUs; default: 1"))
+    parser.add_argument("--io_threads", type=int, default=None,
+                        help=("number of threads that read the next files "
+                              "and write finished ones while a single job "
+                              "wraps; 0 reads and writes each file in turn; "
+                              "default: 4 with several CPUs, otherwise 0"))
+    parser.add_argument("--cache", type=str, default=None,
+                        help=("path to a cache database; files whose output "
+                              "from an earlier run with the same parameters "
+                              "still exists unchanged are skipped"))
+    parser.add_argument("--cache_size", type=int, default=100000,
+                        help=("maximum number of entries kept in each table "
+                              "of the cache; default: 100000"))
+    parser.add_argument("-i", "--incremental", action="store_true",
+                        help=("only wrap the paragraphs of a changed file "
+                              "that are not in the cache (needs --cache)"))
+    parser.add_argument("--include", type=str, nargs="+", default=None,
+                        help=("glob patterns for the files to reformat in "
+                              "directories, matched against the filename or "
+                              "the path relative to the directory; default: "
+                              "all files"))
+    parser.add_argument("--exclude", type=str, nargs="+", default=None,
+                        help=("glob patterns for files and directories to "
+                              "skip in directories"))
+    output = parser.add_mutually_exclusive_group()
+    output.add_argument("-o", "--output_dir", type=str, default=None,
+                        help=("write the new files to this directory, which "
+                              "mirrors the structure of searched directories"))
+    output.add_argument("--in_place", action="store_true",
+                        help=("replace each file atomically by its new "
+                              "contents"))
+    parser.add_argument("--check", action="store_true",
+                        help=("only list the files that would change by "
+                              "reformatting, without writing anything; the "
+                              "exit status is 1 if there are any"))
+    parser.add_argument("--diff", action="store_true",
+                        help=("with --check, print a unified diff for each "
+                              "file that would change instead of its path"))
+    parser.add_argument("--on_error", type=str, default="ask",
+                        choices=["ask", "skip", "abort"],
+                        help=("what to do about invalid paths and files that "
+                              "cannot be reformatted: ask (for invalid paths) "
+                              "and report, skip and report, or abort; "
+                              "default: ask"))
+    parser.add_argument("--stats", action="store_true",
+                        help=("report the time per phase and counters for "
+                              "each file and in total on stderr; the phases "
+                              "run one after the other on the full contents "
+                              "of each file"))
+    parser.add_argument("--stats_format", type=str, default="text",
+                        choices=["text", "json"],
+                        help="format of the --stats report; default: text")
+    parser.add_argument("--profile", type=str, default=None,
+                        help=("write a cProfile profile of the run to this "
+                              "path, e.g., for `python -m pstats PROFILE`"))
+    parser.add_argument("--serve", type=str, default=None, metavar="SOCKET",
+                        help=("run a server on this Unix domain socket that "
+                              "reformats texts and files on request, e.g., "
+                              "via reformat_client.py"))
+    parser.add_argument("--idle_timeout", type=float, default=600,
+                        help=("seconds without requests after which the "
+                              "server stops; 0 never stops; default: 600"))
+    args = parser.parse_args()
+    if args.ncol and len(args.ncol) not in (1, len(args.paths)):
+        parser.error("argument --ncol: expected one value or one value per "
+                     "path")
+    if not args.jobs == 1 and not args.chunk_jobs == 1:
+        parser.error("argument --chunk_jobs: not allowed with argument --jobs")
+    if args.io_threads is None:
+        # a single CPU would only switch between the threads
+        args.io_threads = 4 if (os.cpu_count() or 1) > 1 else 0
+    elif args.io_threads < 0:
+        parser.error("argument --io_threads: must not be negative")
+    if args.incremental and args.cache is None:
+        parser.error("argument -i/--incremental: requires argument --cache")
+    if args.diff and not args.check:
+        parser.error("argument --diff: requires argument --check")
+    if args.check:
+        for option, name in ((args.output_dir, "-o/--output_dir"),
+                             (args.in_place, "--in_place"),
+                             (args.cache, "--cache"), (args.stats, "--stats")):
+            if option:
+                parser.error(f"argument {name}: not allowed with argument "
+                             f"--check")
+    if (args.output_dir is None and not args.in_place and not args.check
+            and any(os.path.isdir(path) for path in args.paths)):
+        parser.error("argument paths: directories require argument "
+                     "-o/--output_dir or --in_place")
+    if '-' in args.paths and len(args.paths) > 1:
+        parser.error("argument paths: '-' not allowed with other paths")
+    if args.serve is not None:
+        for option, name in ((args.paths, "paths"),
+                             (args.output_dir, "-o/--output_dir"),
+                             (args.in_place, "--in_place"),
+                             (args.cache, "--cache"), (args.stats, "--stats"),
+                             (args.profile, "--profile"),
+                             (args.check, "--check")):
+            if option:
+                parser.error(f"argument {name}: not allowed with argument "
+                             f"--serve")
+    elif args.paths in ([], ['-']):
+        for option, name in ((args.output_dir, "-o/--output_dir"),
+                             (args.in_place, "--in_place"),
+                             (args.cache, "--cache"), (args.stats, "--stats"),
+                             (args.check, "--check")):
+            if option:
+                parser.error(f"argument {name}: not allowed when reading "
+                             f"from stdin")
+    if args.profile is not None and not args.jobs == 1:
+        parser.error("argument --profile: not allowed with argument --jobs")
+    return args
     ## accessing arguments - example:
     # args = parser.parse_args() # `args` is now a Namespace that includes the
     #                            # arguments without any leading hyphen, e.g.,
@@ -128,9 +305,14 @@ def yn_prompt(prompt: str, default: str = None, verbose: bool = False) -> bool:
             continue
     return re
 
-def check_paths(paths: list) -> list:
-    """ Test if given paths lead to valid files. """
-    invalid_paths = [p for p in paths if not os.path.isfile(p)]
+def check_paths(paths: list, on_error: str = 'ask') -> list:
+    """ Test if given paths lead to valid files (or directories).
+
+    If some paths are invalid, `on_error` decides whether to 'ask' the user,
+    'skip' these paths or 'abort', i.e., return `None`.
+    """
+    invalid_paths = [p for p in paths
+                     if not (os.path.isfile(p) or os.path.isdir(p))]
     if len(invalid_paths) > 0 : # `if invalid_paths:` would work as well
         if len(paths) == len(invalid_paths):
             print("No valid paths given (no file found).\nreturn None")
@@ -138,7 +320,11 @@ def check_paths(paths: list) -> list:
         print("Following paths are invalid (no file found):")
         for ip in invalid_paths:
             print(f" {ip}")
-        if yn_prompt("Continue without invalid paths?", "y"):
+        if on_error == 'abort':
+            print("return None")
+            return None
+        if on_error == 'skip' or yn_prompt("Continue without invalid paths?",
+                                           "y"):
             print("Using valid paths only.")
             return [p for p in paths if p not in invalid_paths]
         else:
@@ -146,21 +332,1000 @@ def check_paths(paths: list) -> list:
             return None
     return paths # essentially the else case where all paths are valid
 
-def new_filename(path: str) -> str:
-    """ Find a new filename, which does not exist yet. """
-    basename = os.path.basename(path)
-    path_only = path[:-len(basename)]
-    name, ext = basename.rsplit('.')
+def new_filename(path: str, existing: set = None) -> str:
+    """ Find a new filename, which does not exist yet.
+
+    Without `existing`, each name is probed, which usually takes a single
+    test. `existing` can be given as the set of names in the directory of
+    `path` for many calls in a row, in which case the new name is added to it.
+    """
+    path_only, basename = os.path.split(path)
+    name, ext = os.path.splitext(basename)
     counter = 1
-    while os.path.isfile(path_only+name+f"_{counter}.{ext}"):
+    if existing is None:
+        while os.path.exists(os.path.join(path_only,
+                                          f"{name}_{counter}{ext}")):
+            counter += 1
+        return os.path.join(path_only, f"{name}_{counter}{ext}")
+    while f"{name}_{counter}{ext}" in existing:
         counter += 1
-    return path_only+name+f"_{counter}.{ext}"
+    existing.add(f"{name}_{counter}{ext}")
+    return os.path.join(path_only, f"{name}_{counter}{ext}")
 
-def reformatter(
+def _scan_tree(
+        root: str, include: list = None, exclude: list = None,
+        skip: set = frozenset(), onerror=None
+        ):
+    """ Yield tuples `(path, relpath)` for the files below a directory.
+
+    The tree is walked with `os.scandir`, which mostly gets the file type from
+    the directory listing, i.e., without a system call per file. A file is
+    yielded if its name or its path relative to `root` matches any glob
+    pattern in `include` (any file if not given) and none in `exclude`.
+    Directories that match `exclude` or whose absolute path is in `skip` are
+    not entered, symbolic links to directories are not followed. An `OSError`
+    from listing a directory is passed to `onerror` if given, and raised
+    otherwise.
+    """
+    def matches(name, relpath, patterns):
+        return any(fnmatch.fnmatch(name, pattern)
+                   or fnmatch.fnmatch(relpath, pattern)
+                   for pattern in patterns)
+
+    stack = [(root, '')]
+    while stack:
+        directory, prefix = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError as error:
+            if onerror is None:
+                raise
+            onerror(error)
+            continue
+        subdirs = []
+        for entry in entries:
+            relpath = prefix + entry.name
+            if exclude and matches(entry.name, relpath, exclude):
+                continue
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if not (skip and os.path.abspath(entry.path) in skip):
+                        subdirs.append((entry.path, relpath + os.sep))
+                    continue
+                is_file = entry.is_file()
+            except OSError: # e.g., removed in the meantime
+                continue
+            if is_file and (not include or matches(entry.name, relpath,
+                                                   include)):
+                yield entry.path, relpath
+        stack.extend(reversed(subdirs)) # visit in sorted order
+
+def _output_collisions(files: list) -> dict:
+    """ Find the files whose output path is the output of another file, too.
+
+    `files` holds tuples of one path, one ncol and one output path (see
+    `_reformat_files`), e.g., files with the same name from different paths
+    for an output directory. Returns a dict of the indices of the colliding
+    files and a ValueError for each, which names the other files. The same
+    file given twice does not collide with itself.
+    """
+    indices = collections.defaultdict(list)
+    for index, (_, _, output) in enumerate(files):
+        if output is not None:
+            indices[os.path.normcase(os.path.abspath(output))].append(index)
+    collisions = {}
+    for group in indices.values():
+        inputs = [os.path.abspath(files[index][0]) for index in group]
+        for index, path in zip(group, inputs):
+            others = list(dict.fromkeys( # unique, in order
+                files[other][0] for other, other_path in zip(group, inputs)
+                if not other_path == path))
+            if others:
+                collisions[index] = ValueError(
+                    f"output {files[index][2]} is the output of "
+                    f"{', '.join(others)} as well")
+    return collisions
+
+## Display width
+# In the 'display' width mode, words and lines are measured by the number of
+# columns they take up in a terminal or an editor with a monospaced font: East
+# Asian wide and fullwidth characters (incl. most emoji) take two columns,
+# combining marks, format characters (e.g., zero-width spaces and joiners) and
+# conjoining Hangul vowels and final consonants none, and all other characters
+# one. Asking `unicodedata` for every character would be far too slow, so the
+# widths are kept as a compact table of ranges of the same width, which is
+# built from `unicodedata` for each block of codepoints on its first use and
+# searched by bisection. The width of each character that occurs is kept in a
+# dict, each word is measured only once (see `_word_width`), and lines of
+# ASCII characters only skip all of this, as their width equals their length.
+_WIDTH_BLOCK_BITS = 12 # i.e., blocks of 4096 codepoints
+_WIDTH_TABLE = {} # block -> (first codepoint of each range, width of each)
+_ZERO_WIDTH_CATEGORIES = frozenset(('Mn', 'Me', 'Cf'))
+
+def _width_block(block: int) -> tuple:
+    """ Build the ranges of the same display width within a block. """
+    first = block << _WIDTH_BLOCK_BITS
+    starts, widths = [], []
+    for code in range(first, first + (1 << _WIDTH_BLOCK_BITS)):
+        char = chr(code)
+        if (unicodedata.category(char) in _ZERO_WIDTH_CATEGORIES
+                or 0x1160 <= code <= 0x11FF):
+            width = 0
+        elif unicodedata.east_asian_width(char) in ('W', 'F'):
+            width = 2
+        else:
+            width = 1
+        if not widths or not widths[-1] == width:
+            starts.append(code)
+            widths.append(width)
+    return starts, widths
+
+def _char_width(char: str) -> int:
+    """ Look up the display width of a single character. """
+    code = ord(char)
+    block = code >> _WIDTH_BLOCK_BITS
+    table = _WIDTH_TABLE.get(block)
+    if table is None:
+        table = _WIDTH_TABLE[block] = _width_block(block)
+    starts, widths = table
+    return widths[bisect.bisect_right(starts, code)-1]
+
+class _CharWidths(dict):
+    """ Display widths of the characters seen so far, which are looked up in
+    the table once (see `_char_width`).
+    """
+
+    def __missing__(self, char: str) -> int:
+        width = self[char] = _char_width(char)
+        return width
+
+_CHAR_WIDTHS = _CharWidths()
+
+def _display_width(text: str) -> int:
+    """ Measure the number of columns a text takes up (see `## Display
+    width`).
+    """
+    if text.isascii():
+        return len(text)
+    return sum(map(_CHAR_WIDTHS.__getitem__, text))
+
+@functools.lru_cache(maxsize=2**16)
+def _word_width(word: str) -> int:
+    """ Measure the display width of a word, but each word only once. """
+    return _display_width(word)
+
+def _display_widths(line: str, lengths: list) -> list:
+    """ Get the display widths of the words of a split line.
+
+    `lengths` are the lengths of the words (see `_compile_tokenizer`), which
+    are also their widths if the line is made of ASCII characters only.
+    """
+    if line.isascii():
+        return lengths
+    widths = []
+    start = 0
+    for size in lengths:
+        widths.append(_word_width(line[start:start+size]))
+        start += size+1
+    return widths
+
+def _measure(width_mode: str = 'chars'):
+    """ Get the function that measures a text in the given width mode, i.e.,
+    `len` for 'chars' or `_display_width` for 'display'.
+    """
+    if width_mode == 'chars':
+        return len
+    if width_mode == 'display':
+        return _display_width
+    raise ValueError(f"unknown width mode '{width_mode}'")
+
+## Wrapping engine
+# Each line is split into words, which are followed by a separator: a
+# whitespace, a breakchar or the end of the line. Instead of creating an
+# object for every word, a line is kept as its text together with two columns:
+# the lengths of its words and the codes of their separators. A word starts
+# right after the previous separator, such that each word is found as a slice
+# of the original line and is never copied. Separators are noted by a code: the
+# empty str '' for a whitespace or the end of the line, the breakchar itself,
+# or '\n' for a linebreak. As small ints and single characters are shared
+# objects in Python, the columns do not allocate anything per word.
+# Lines are passed on one after another together with the information whether
+# they end with a manual linebreak. The lines are consumed exactly once, such
+# that the whole process takes linear time with respect to the input size.
+_NEWLINE = ('', '\n', 0)
+
+def _iter_lines(lines, preserve_empty_lines: bool = True):
+    """ Generate lines, each with a trailing new line character. """
+    for line in lines:
+        if preserve_empty_lines or line[:-1]: # whitespaces count as content!
+            # Only the last line of a file can miss its trailing new line
+            # character. Adding it saves some special treatment of this line.
+            yield line if line.endswith('\n') else line+'\n'
+
+def _tokenize_line_chars(line: str, breakchars: list) -> list:
+    """ Split a line (incl. its trailing new line) into word tokens.
+
+    Each token is a tuple `(word, sep, length)` of the word itself, the
+    character that follows it (the empty str '' for a whitespace) and the
+    length of the word. This is the plain per-character reference of
+    `_compile_tokenizer`.
+    """
+    tokens = []
+    word = []
+    for char in line:
+        if char == ' ':
+            tokens.append((''.join(word), ''))
+            word = []
+        elif char in breakchars:
+            tokens.append((''.join(word), char))
+            word = []
+        elif char == '\n' and word:
+            tokens.append((''.join(word), ''))
+        else:
+            word.append(char)
+    if not tokens: # empty line
+        return [_NEWLINE]
+    return [(w, s, len(w)) for w, s in tokens]
+
+@functools.lru_cache(maxsize=256)
+def _compile_tokenizer(breakchars: tuple):
+    """ Build a function that splits lines into words for `breakchars`.
+
+    The returned function takes a line (incl. its trailing new line) and
+    returns a tuple of two columns: the length of each word and the code of
+    each word's separator. It splits the whole line at once with a regex that
+    is compiled only once for each of the last 256 tuples of `breakchars`.
+    """
+    # a breakchar can only ever match a single character
+    seps = ''.join(c for c in breakchars if len(c) == 1 and not c == ' ')
+    split = re.compile('([ '+re.escape(seps)+'])').split
+    # a new line character is only a separator, if it is a breakchar itself
+    end = None if '\n' in seps else -1
+    sep_codes = dict(zip(seps, seps))
+    sep_codes[' '] = ''
+
+    def split_line(line: str) -> tuple:
+        pieces = split(line[:end])
+        # `pieces` alternates between words and separators, ending with a word
+        lengths = list(map(len, pieces[::2]))
+        codes = list(map(sep_codes.__getitem__, pieces[1::2]))
+        if pieces[-1]: # last word, not followed by any separator
+            codes.append('')
+        else:
+            lengths.pop()
+        return lengths, codes
+
+    return split_line
+
+def _tokenize_line(line: str, breakchars: list) -> list:
+    """ Split a line into tuples `(word, sep, length)` for each word. """
+    lengths, codes = _compile_tokenizer(tuple(breakchars))(line)
+    tokens = []
+    start = 0
+    for size, sep in zip(lengths, codes):
+        tokens.append((line[start:start+size], sep, size))
+        start += size+1
+    return tokens or [_NEWLINE] # empty line
+
+def _manual_break(
+        old_len: int, next_token: tuple, ncol: int, preserve_breaks: bool,
+        startchars: list
+        ) -> bool:
+    """ Decide whether a line ends with a manual linebreak.
+
+    `old_len` is the length of the line itself and `next_token` is the first
+    token `(word, sep, length)` of the following line.
+    """
+    next_word, next_sep, next_len = next_token
+    # initial line is longer than new max, i.e., should be manual break
+    if preserve_breaks and old_len > ncol:
+        return True
+    # check start of next line
+    if ((next_sep == '\n') # empty line
+        or (not next_word and not next_sep
+            and ' ' in startchars) # whitespace & it is a startchar
+        or (not next_word and next_sep in
+            startchars) # lone breakchar, which is also a startchar
+        or (preserve_breaks and (next_len + old_len <= ncol)) # next word ...
+            # ... would still fit on current line
+        ):
+        return True
+    # any other leading startchar (a leading whitespace, which is not a
+    # startchar, leaves the next word empty, i.e., there is nothing to check)
+    return bool(next_word) and next_word[0] in startchars
+
+def _iter_split_lines(
+        lines, ncol: int, preserve_breaks: bool = True,
+        breakchars: list = ['-', '/'],
+        startchars: list = [' ', '-', '*', '>', '\t'],
+        last_break: bool = False, split_line=None, width_mode: str = 'chars'
+        ):
+    """ Generate tuples `(line, lengths, seps, manual_break)` for all lines.
+
+    Each line needs to end with a new line character. `lengths` and `seps`
+    are the columns of its words (see `_compile_tokenizer`), which are found
+    by `split_line(line)` if given. Only a one-line lookahead is kept, as this
+    is all the detection of manual linebreaks needs. Empty lines have no
+    words, but always end with a linebreak. If `last_break` is set, the last
+    line ends with a manual linebreak, e.g., because it is followed by further
+    lines that are handled separately. Lines and words are measured in
+    `width_mode` (see `_measure`) to detect manual linebreaks.
+    """
+    if split_line is None:
+        split_line = _compile_tokenizer(tuple(breakchars))
+    measure = _measure(width_mode)
+    prev = None
+    for line in lines:
+        lengths, seps = split_line(line)
+        if prev is not None:
+            if not prev[1]: # empty line
+                yield prev + (True,)
+            elif prev[2][0] == '\n': # skip lines that start with a new line
+                yield prev + (False,)
+            else:
+                first = ((line[:lengths[0]], seps[0], lengths[0]) if lengths
+                         else _NEWLINE)
+                if lengths and measure is not len:
+                    first = first[:2] + (_word_width(first[0]),)
+                yield prev + (_manual_break(measure(prev[0])-1, first, ncol,
+                                            preserve_breaks, startchars),)
+        prev = line, lengths, seps
+    # the last line has no following line to check
+    if prev is not None:
+        yield prev + (not prev[1] or (last_break and not prev[2][0] == '\n'),)
+
+def _wrap_lines(split_lines, ncol: int, width_mode: str = 'chars'):
+    """ Generate the reformatted lines from split lines.
+
+    Words are placed greedily up to the line length `ncol`, where they are
+    measured in `width_mode` (see `_measure`). Consecutive words of the same
+    input line are written as one slice of that line. Every generated line
+    ends with a new line character, except for the very last one, if the
+    input does not end with a linebreak itself.
+    """
+    display = _measure(width_mode) is _display_width
+    parts = [] # rendered slices of the current line
+    text, first, last = None, 0, 0 # slice of the current input line
+    pending = False # the last word's trailing whitespace is not written yet
+    length = 0
+    sep = '\n'
+    for line, lengths, seps, manual_break in split_lines:
+        start = 0
+        widths = _display_widths(line, lengths) if display else lengths
+        for size, width, sep in zip(lengths, widths, seps):
+            end = start+size
+            if size: # the word contains at least one character
+                # word still fits in line (a trailing breakchar counts as well)
+                if length+width+(1 if sep else 0) <= ncol:
+                    length += width+1
+                else: # line is full
+                    if text is not None:
+                        parts.append(text[first:last])
+                    parts.append('\n')
+                    yield ''.join(parts)
+                    parts, text, pending, length = [], None, False, width+1
+                # a whitespace is only written, if the word is followed by
+                # something other than a new line
+                stop = end+1 if sep else end
+            elif sep == '\n': # new line
+                if text is not None:
+                    parts.append(text[first:last])
+                parts.append('\n')
+                yield ''.join(parts)
+                parts, text, pending, length = [], None, False, 0
+                start = end+1
+                continue
+            else: # lone whitespace or breakchar
+                if length+1 <= ncol:
+                    length += 1
+                else: # max allowed length would be exceeded
+                    if text is not None:
+                        parts.append(text[first:last])
+                    parts.append('\n')
+                    yield ''.join(parts)
+                    parts, text, pending, length = [], None, False, 1
+                stop = end+1
+            # extend the slice of the current input line, if possible
+            if text is not None and start == last+pending and (
+                    not pending or not sep == '\n'):
+                last = stop
+            else:
+                if text is not None:
+                    parts.append(text[first:last])
+                if pending and not sep == '\n':
+                    parts.append(' ')
+                text, first, last = line, start, stop
+            pending = size and not sep
+            start = end+1
+        if text is not None:
+            parts.append(text[first:last])
+            text = None
+        if manual_break:
+            parts.append('\n')
+            yield ''.join(parts)
+            parts, pending, length = [], False, 0
+            sep = '\n'
+    # The input is closed by a new line character, which is removed again, if
+    # the last word was not followed by a linebreak itself.
+    if not sep == '\n':
+        yield ''.join(parts)
+
+def _optimal_breaks(widths: list, gaps: list, ncol: int) -> list:
+    """ Find the line breaks of a paragraph with the least raggedness.
+
+    `widths` are the widths of the items (words and lone separators) and
+    `gaps` the whitespaces that follow them, unless they end a line. A line
+    costs the square of its unused columns, or the square of its excess
+    columns times a factor that outweighs any raggedness, if it is overfull.
+    The last line is free, as long as it fits. Returns the index after the
+    last item of each line.
+
+    As the cost is a convex function of the line width, the best start of a
+    line never moves backwards, when the end of the line moves forward. Each
+    candidate start is kept in a deque together with the first line end for
+    which it is the best one. This end is found by galloping ahead and then a
+    binary search. It usually lies within the next line, but not always,
+    e.g., after items of zero width or overfull lines. Thus, the run time is
+    about O(n log k) for n items and at most k items per line, instead of
+    O(n^2).
+    """
+    n = len(widths)
+    starts = [0]*n # column of each item, if all items were on one line
+    for k in range(1, n):
+        starts[k] = starts[k-1] + widths[k-1] + gaps[k-1]
+    ends = [start+width for start, width in zip(starts, widths)]
+    overfull = (ncol+1)**2 * (n+1)
+
+    def total(i, j): # least cost of all lines, if the last one has items i-j
+        width = ends[j] - starts[i]
+        if width <= ncol:
+            return best[i] + (ncol-width)**2
+        return best[i] + overfull*(width-ncol)**2
+
+    best = [0]*(n+1) # least cost of the items before k, if a line starts at k
+    prev = [0]*(n+1) # start of the line that ends before k
+    candidates = collections.deque() # [start, first line end it is best for]
+    for j in range(n):
+        # a line may start at item j, once the lines before it are known
+        while candidates:
+            i, first = candidates[-1]
+            first = max(first, j)
+            if not total(j, first) < total(i, first):
+                break
+            candidates.pop()
+        if not candidates:
+            candidates.append([j, j])
+        else:
+            # first line end for which j is better than i: gallop ahead
+            # until j is better, then bisect the last step
+            lo = hi = first+1
+            step = 1
+            while hi < n and not total(j, hi) < total(i, hi):
+                lo = hi+1
+                hi += step
+                step *= 2
+            hi = min(hi, n)
+            while lo < hi:
+                mid = (lo+hi) // 2
+                if total(j, mid) < total(i, mid):
+                    hi = mid
+                else:
+                    lo = mid+1
+            if lo < n:
+                candidates.append([j, lo])
+        while len(candidates) > 1 and candidates[1][1] <= j:
+            candidates.popleft()
+        i = candidates[0][0]
+        best[j+1] = total(i, j)
+        prev[j+1] = i
+
+    # the last line is free, as long as it fits, i.e., try each start
+    last, cost = n, None
+    for i in range(n-1, -1, -1):
+        fits = ends[-1] - starts[i] <= ncol
+        value = best[i] if fits else total(i, n-1)
+        if cost is None or value < cost:
+            last, cost = i, value
+    breaks = [n]
+    while last > 0:
+        breaks.append(last)
+        last = prev[last]
+    return breaks[::-1]
+
+def _wrap_lines_optimal(split_lines, ncol: int, width_mode: str = 'chars'):
+    """ Generate the reformatted lines from split lines with balanced lengths.
+
+    Does the same as `_wrap_lines`, but instead of placing words greedily,
+    the line breaks of each paragraph are chosen for the least raggedness
+    (see `_optimal_breaks`). Paragraphs end at manual linebreaks and at new
+    lines, such that only one paragraph is kept in memory. Unlike
+    `_wrap_lines`, an overlong word never leaves an empty line before it.
+    """
+    display = _measure(width_mode) is _display_width
+    # items of the current paragraph: (line, start, stop, whitespace follows)
+    items = []
+    widths, gaps = [], []
+
+    def paragraph(newline):
+        """ Generate the lines of the current paragraph. """
+        first = 0
+        for end in _optimal_breaks(widths, gaps, ncol):
+            parts = []
+            text, start, stop, pending = items[first]
+            for line, item_start, item_stop, item_pending in (
+                    items[first+1:end]):
+                # extend the slice of the current input line, if possible
+                if line is text and item_start == stop+pending:
+                    stop = item_stop
+                else:
+                    parts.append(text[start:stop])
+                    if pending:
+                        parts.append(' ')
+                    text, start = line, item_start
+                    stop = item_stop
+                pending = item_pending
+            parts.append(text[start:stop])
+            if newline or not end == len(items):
+                parts.append('\n')
+            yield ''.join(parts)
+            first = end
+
+    for line, lengths, seps, manual_break in split_lines:
+        start = 0
+        word_widths = _display_widths(line, lengths) if display else lengths
+        for size, width, sep in zip(lengths, word_widths, seps):
+            end = start+size
+            if not size and sep == '\n': # new line
+                if items:
+                    yield from paragraph(True)
+                    items, widths, gaps = [], [], []
+                else:
+                    yield '\n'
+            elif size and not sep: # word followed by a whitespace
+                items.append((line, start, end, True))
+                widths.append(width)
+                gaps.append(1)
+            else: # word with a breakchar, lone whitespace or breakchar
+                items.append((line, start, end+1, False))
+                widths.append(width+1)
+                gaps.append(0)
+            start = end+1
+        if manual_break:
+            if items:
+                yield from paragraph(True)
+                items, widths, gaps = [], [], []
+            else:
+                yield '\n'
+    # as for `_wrap_lines`, the last line has no new line character
+    if items:
+        yield from paragraph(False)
+
+def _wrap(
+        split_lines, ncol: int, wrap_mode: str = 'greedy',
+        width_mode: str = 'chars'
+        ):
+    """ Wrap split lines either 'greedy' (see `_wrap_lines`) or 'optimal' (see
+    `_wrap_lines_optimal`).
+    """
+    if wrap_mode == 'greedy':
+        return _wrap_lines(split_lines, ncol, width_mode)
+    if wrap_mode == 'optimal':
+        return _wrap_lines_optimal(split_lines, ncol, width_mode)
+    raise ValueError(f"unknown wrap mode '{wrap_mode}'")
+
+def _reformat_lines(
+        lines, ncol: int, preserve_breaks: bool = True,
+        breakchars: list = ['-', '/'],
+        startchars: list = [' ', '-', '*', '>', '\t'],
+        last_break: bool = False, wrap_mode: str = 'greedy',
+        width_mode: str = 'chars'
+        ):
+    """ Generate the reformatted lines (see `_iter_split_lines` and `_wrap`).
+    """
+    return _wrap(_iter_split_lines(lines, ncol, preserve_breaks, breakchars,
+                                   startchars, last_break,
+                                   width_mode=width_mode),
+                 ncol, wrap_mode, width_mode)
+
+def _write_new_file(
+        path: str, lines, output: str = None, binary: bool = False) -> str:
+    """ Write the lines for the input file `path` and return the new path.
+
+    The new file is `output` if given (which may be `path` itself), otherwise
+    a new file next to `path` (see `new_filename`). The lines go to a
+    temporary file first, which is renamed once it is complete, i.e., a failed
+    run does not leave a half-written file behind and an existing `output` is
+    replaced atomically. The new file gets the permissions of `path`. With
+    `binary` the lines are bytes that are written as they are.
+    """
+    target = path if output is None else output
+    outfile = tempfile.NamedTemporaryFile(
+        'wb' if binary else 'w', dir=os.path.dirname(target) or '.',
+        prefix='.'+os.path.basename(target)+'.', suffix='.tmp', delete=False)
+    try:
+        with outfile:
+            outfile.writelines(lines)
+        shutil.copymode(path, outfile.name)
+        new_path = new_filename(path) if output is None else output
+        os.replace(outfile.name, new_path)
+    except BaseException:
+        os.remove(outfile.name)
+        raise
+    return new_path
+
+def _reformat_stream(
         path: str, ncol: int = None, preserve_breaks: bool = True,
         preserve_empty_lines: bool = True, breakchars: list = ['-', '/'],
-        startchars: list = [' ', '-', '*', '>', '\t']
+        startchars: list = [' ', '-', '*', '>', '\t'], output: str = None,
+        wrap_mode: str = 'greedy', width_mode: str = 'chars'
+        ) -> str:
+    """ Reformat a file line by line and return the path of the new file.
+
+    Only a one-line lookahead (and the current paragraph in the 'optimal'
+    `wrap_mode`) is kept in memory, finished lines are written right away. If
+    `ncol` is not specified, the input is read twice.
+    """
+    if ncol is None:
+        measure = _measure(width_mode)
+        with open(path, 'r') as infile:
+            ncol = max((measure(line)-1 for line in
+                        _iter_lines(infile, preserve_empty_lines)),
+                       default=None)
+
+    with open(path, 'r') as infile:
+        lines = _iter_lines(infile, preserve_empty_lines)
+        first = next(lines, None)
+        if first is None:
+            raise ValueError(f"nothing to reformat in '{path}'")
+        return _write_new_file(path, _reformat_lines(
+            itertools.chain([first], lines), ncol, preserve_breaks,
+            breakchars, startchars, wrap_mode=wrap_mode,
+            width_mode=width_mode), output)
+
+def _reformat_pipe(
+        infile, outfile, ncol: int = None, preserve_breaks: bool = True,
+        preserve_empty_lines: bool = True, breakchars: list = ['-', '/'],
+        startchars: list = [' ', '-', '*', '>', '\t'],
+        wrap_mode: str = 'greedy', width_mode: str = 'chars'
+        ):
+    """ Reformat the lines of a text stream and write them to another one.
+
+    This is the filter for pipelines, e.g., from stdin to stdout. As for
+    `_reformat_stream`, only a one-line lookahead is kept in memory. The
+    output is flushed after each paragraph, i.e., at every hard break (see
+    `_hard_break`), such that a consumer gets it right away. If `ncol` is not
+    specified, the input is spooled to a temporary file first to find the
+    longest line. Nothing is written for empty input.
+    """
+    if ncol is None:
+        # lone surrogates may come from undecodable bytes (see `sys.stdin`)
+        spool = io.TextIOWrapper(tempfile.TemporaryFile(), encoding='utf-8',
+                                 errors='surrogatepass', newline='')
+        with spool:
+            measure = _measure(width_mode)
+            ncol = 0
+            for line in _iter_lines(infile, preserve_empty_lines):
+                ncol = max(ncol, measure(line)-1)
+                spool.write(line)
+            spool.seek(0)
+            return _reformat_pipe(spool, outfile, ncol, preserve_breaks,
+                                  preserve_empty_lines, breakchars,
+                                  startchars, wrap_mode, width_mode)
+
+    def flush_after_breaks(split_lines):
+        for split_line in split_lines:
+            yield split_line
+            # all lines up to the break are written once the next one is asked
+            if split_line[3]:
+                outfile.flush()
+
+    lines = _iter_lines(infile, preserve_empty_lines)
+    split_lines = _iter_split_lines(lines, ncol, preserve_breaks, breakchars,
+                                    startchars, width_mode=width_mode)
+    for line in _wrap(flush_after_breaks(split_lines), ncol, wrap_mode,
+                      width_mode):
+        outfile.write(line)
+    outfile.flush()
+
+def _decode_lines(data: bytes, encoding: str):
+    """ Decode bytes into lines just like reading a file in text mode. """
+    return io.TextIOWrapper(io.BytesIO(data), encoding=encoding)
+
+@functools.lru_cache(maxsize=256)
+def _compile_first_token(breakchars: tuple):
+    """ Build a function that only finds the first token of a line.
+
+    The returned function gives the same tuple `(word, sep, length)` as
+    `_tokenize_line(line, breakchars)[0]`, but stops at the first separator.
+    """
+    seps = ''.join(c for c in breakchars if len(c) == 1 and not c == ' ')
+    search = re.compile('[ '+re.escape(seps)+']').search
+    end = 0 if '\n' in seps else 1
+    sep_codes = dict(zip(seps, seps))
+    sep_codes[' '] = ''
+
+    def first_token(line: str) -> tuple:
+        match = search(line, 0, len(line)-end)
+        if match is None: # a single word or an empty line
+            word = line[:-1]
+            return (word, '', len(word)) if word else _NEWLINE
+        word = line[:match.start()]
+        return word, sep_codes[match.group()], len(word)
+
+    return first_token
+
+def _hard_break(
+        line: str, first: tuple, next_first: tuple, ncol: int,
+        preserve_breaks: bool, breakchars: list, startchars: list,
+        width_mode: str = 'chars'
+        ) -> bool:
+    """ Test if the wrap of the line after `line` is independent of `line`.
+
+    This is the case if `line` ends with a manual linebreak or is an empty
+    line itself, as both reset the wrap to the start of a new line. `first`
+    and `next_first` are the first tokens of `line` and of the next line (see
+    `_compile_first_token`). Lines and words are measured in `width_mode`
+    (see `_measure`).
+    """
+    if first[1] == '\n': # no manual linebreak is added (e.g., empty lines)
+        return (first == _NEWLINE
+                or _tokenize_line(line, breakchars)[-1] == _NEWLINE)
+    measure = _measure(width_mode)
+    if measure is not len:
+        next_first = next_first[:2] + (_word_width(next_first[0]),)
+    return _manual_break(measure(line)-1, next_first, ncol, preserve_breaks,
+                         startchars)
+
+def _split_paragraphs(
+        lines: list, ncol: int, preserve_breaks: bool = True,
+        breakchars: list = ['-', '/'],
+        startchars: list = [' ', '-', '*', '>', '\t'],
+        width_mode: str = 'chars'
+        ) -> list:
+    """ Split lines into paragraphs, which can be wrapped independently.
+
+    Returns a list of lists of lines. Each paragraph but the last one ends
+    with a hard break (see `_hard_break`).
+    """
+    firsts = list(map(_compile_first_token(tuple(breakchars)), lines))
+    paragraphs = []
+    start = 0
+    for n in range(1, len(lines)):
+        if _hard_break(lines[n-1], firsts[n-1], firsts[n], ncol,
+                       preserve_breaks, breakchars, startchars, width_mode):
+            paragraphs.append(lines[start:n])
+            start = n
+    if lines:
+        paragraphs.append(lines[start:])
+    return paragraphs
+
+def _split_points(
+        data, ncol: int, chunk_size: int, encoding: str,
+        preserve_breaks: bool = True, preserve_empty_lines: bool = True,
+        breakchars: list = ['-', '/'],
+        startchars: list = [' ', '-', '*', '>', '\t'],
+        width_mode: str = 'chars'
         ) -> list:
+    """ Find offsets at which the file contents `data` can be split.
+
+    Starting every `chunk_size` bytes, the next line that follows a hard break
+    (see `_hard_break`) is searched. Returns the sorted start offsets of all
+    chunks, which can then be wrapped independently of each other. Each search
+    decodes the whole lines of the next `chunk_size` bytes (at least 64 KiB)
+    at once. Without a hard break in there, the rest of the file stays one
+    chunk, instead of being searched in this process, e.g., with
+    `preserve_breaks` off and no empty lines.
+    """
+    first_token = _compile_first_token(tuple(breakchars))
+    window = max(chunk_size, 2**16)
+    points = [0]
+    size = len(data)
+    pos = chunk_size
+    while pos < size:
+        start = data.find(b'\n', pos) + 1 # start of the next line
+        if not 0 < start < size:
+            break
+        stop = data.find(b'\n', min(start+window, size)-1) + 1 or size
+        point = None
+        prev = None
+        for text in data[start:stop].decode(encoding).split('\n'):
+            if not start < stop:
+                break
+            found = data.find(b'\n', start, stop)
+            end = found+1 if found >= 0 else stop
+            if found >= 0:
+                text += '\n'
+            # one line of bytes may still contain several lines (e.g., '\r')
+            lines = list(_iter_lines(
+                io.StringIO(text, newline=None) if '\r' in text else [text],
+                preserve_empty_lines))
+            if lines:
+                if prev is not None and _hard_break(
+                        prev, first_token(prev), first_token(lines[0]), ncol,
+                        preserve_breaks, breakchars, startchars, width_mode):
+                    point = start
+                    break
+                prev = lines[-1]
+            start = end
+        if point is None: # no hard break within the window
+            break
+        points.append(point)
+        pos = point + chunk_size
+    return points
+
+def _reformat_chunk(
+        path: str, start: int, end: int, last: bool, ncol: int,
+        encoding: str, preserve_breaks: bool = True,
+        preserve_empty_lines: bool = True, breakchars: list = ['-', '/'],
+        startchars: list = [' ', '-', '*', '>', '\t'],
+        wrap_mode: str = 'greedy', width_mode: str = 'chars'
+        ) -> str:
+    """ Reformat the bytes `start` to `end` of a file (see `_split_points`).
+
+    Every chunk but the `last` one ends with a hard break.
+    """
+    with open(path, 'rb') as infile:
+        infile.seek(start)
+        data = infile.read(end-start)
+    lines = _iter_lines(_decode_lines(data, encoding), preserve_empty_lines)
+    return ''.join(_reformat_lines(
+        lines, ncol, preserve_breaks, breakchars, startchars,
+        last_break=not last, wrap_mode=wrap_mode, width_mode=width_mode))
+
+def _imap_ordered(executor, func, args_list, window: int):
+    """ Submit `func(*args)` to an executor and yield results in order.
+
+    At most `window` calls are in flight at once, such that finished results
+    do not pile up in memory while waiting for an earlier one. If the caller
+    stops early, calls that did not start yet are cancelled.
+    """
+    futures = collections.deque()
+    try:
+        for args in args_list:
+            futures.append(executor.submit(func, *args))
+            if len(futures) >= window:
+                yield futures.popleft().result()
+        while futures:
+            yield futures.popleft().result()
+    finally: # the caller stopped early, i.e., drop calls that did not start
+        for future in futures:
+            future.cancel()
+
+def _reformat_chunks(
+        path: str, ncol: int = None, preserve_breaks: bool = True,
+        preserve_empty_lines: bool = True, breakchars: list = ['-', '/'],
+        startchars: list = [' ', '-', '*', '>', '\t'], jobs: int = 0,
+        chunk_size: int = 2**24, output: str = None,
+        wrap_mode: str = 'greedy', width_mode: str = 'chars'
+        ) -> str:
+    """ Reformat a file in chunks on a pool of processes.
+
+    Empty lines and manual linebreaks are hard boundaries that a wrap never
+    crosses. The memory-mapped file is split at these boundaries into chunks
+    of roughly `chunk_size` bytes, which are wrapped in parallel on `jobs`
+    processes (0 uses all CPUs) and put back together in order. Returns the
+    path of the new file, which is identical to the serial result.
+    """
+    with open(path, 'r') as infile:
+        encoding = infile.encoding
+        if ncol is None:
+            measure = _measure(width_mode)
+            ncol = max((measure(line)-1 for line in
+                        _iter_lines(infile, preserve_empty_lines)),
+                       default=None)
+    if os.path.getsize(path) == 0 or ncol is None:
+        raise ValueError(f"nothing to reformat in '{path}'")
+    if not '\n'.encode(encoding) == b'\n': # no byte-wise search for lines
+        return _reformat_stream(path, ncol, preserve_breaks,
+                                preserve_empty_lines, breakchars, startchars,
+                                output, wrap_mode, width_mode)
+
+    with open(path, 'rb') as infile, \
+         mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        size = len(data)
+        points = _split_points(data, ncol, chunk_size, encoding,
+                               preserve_breaks, preserve_empty_lines,
+                               breakchars, startchars, width_mode)
+    if len(points) == 1:
+        return _reformat_stream(path, ncol, preserve_breaks,
+                                preserve_empty_lines, breakchars, startchars,
+                                output, wrap_mode, width_mode)
+
+    workers = jobs or os.cpu_count() or 1
+    bounds = list(zip(points, points[1:]+[size]))
+    args_list = [
+        (path, start, end, end == size, ncol, encoding, preserve_breaks,
+         preserve_empty_lines, breakchars, startchars, wrap_mode, width_mode)
+        for start, end in bounds
+    ]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunks = _imap_ordered(executor, _reformat_chunk, args_list,
+                               2*workers)
+        return _write_new_file(path, chunks, output)
+
+def _lap(stats: dict, phase: str, start: float) -> float:
+    """ Note the wall time since `start` for a phase in `stats` (if given).
+
+    Returns the current time, i.e., the start of the next phase.
+    """
+    now = time.perf_counter()
+    if stats is not None:
+        stats.setdefault('time', {})[phase] = now - start
+    return now
+
+def _peak_memory() -> int:
+    """ Get the peak resident memory of this process so far in bytes.
+
+    This is the peak of the whole process (or of any of its child processes
+    that finished, e.g., of `--jobs`), not of a single file. Returns `None` if
+    the `resource` module is not available.
+    """
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak if sys.platform == 'darwin' else peak*1024 # kB on Linux
+
+def _reformat_phases(
+        path: str, ncol: int, preserve_breaks: bool = True,
+        preserve_empty_lines: bool = True, breakchars: list = ['-', '/'],
+        startchars: list = [' ', '-', '*', '>', '\t'], output: str = None,
+        stats: dict = None, wrap_mode: str = 'greedy',
+        width_mode: str = 'chars'
+        ) -> str:
+    """ Reformat a file one phase after the other and note stats for each.
+
+    Usually all phases handle one line after another, such that their times
+    cannot be told apart. Here, each phase handles all lines before the next
+    one starts, which needs more memory, but gives the same output. See
+    `reformatter` for the contents of `stats`.
+    """
+    start = time.perf_counter()
+    with open(path, 'r') as infile:
+        content = list(_iter_lines(infile, preserve_empty_lines))
+    if not content:
+        raise ValueError(f"nothing to reformat in '{path}'")
+    if ncol is None:
+        measure = _measure(width_mode)
+        ncol = max(measure(line)-1 for line in content)
+    start = _lap(stats, 'read', start)
+
+    columns = list(map(_compile_tokenizer(tuple(breakchars)), content))
+    start = _lap(stats, 'tokenize', start)
+
+    columns = iter(columns) # hand out the columns of each line in order
+    split_lines = list(_iter_split_lines(
+        content, ncol, preserve_breaks, breakchars, startchars,
+        split_line=lambda line: next(columns), width_mode=width_mode))
+    start = _lap(stats, 'breaks', start)
+
+    new_content = list(_wrap(split_lines, ncol, wrap_mode, width_mode))
+    start = _lap(stats, 'wrap', start)
+
+    new_path = _write_new_file(path, new_content, output)
+    _lap(stats, 'write', start)
+
+    if stats is not None:
+        stats.update(
+            bytes = os.path.getsize(path),
+            lines = len(content),
+            tokens = sum(len(lengths) for _, lengths, _, _ in split_lines),
+            # empty lines always end with a linebreak
+            manual_breaks = sum(1 for _, lengths, _, manual_break
+                                in split_lines if manual_break and lengths),
+            lines_out = len(new_content)
+        )
+    return new_path
+
+def reformatter(
+        path: str, ncol: int = None, preserve_breaks: bool = True,
+        preserve_empty_lines: bool = True, breakchars: list = ['-', '/'],
+        startchars: list = [' ', '-', '*', '>', '\t'],
+        stream: bool = False, chunk_jobs: int = 1, chunk_size: int = 2**24,
+        output: str = None, stats: dict = None, profiler=None,
+        wrap_mode: str = 'greedy', width_mode: str = 'chars'
+        ) -> str:
     """Reformat file contents to a given line length.
 
     Parameters:
@@ -183,11 +1348,49 @@ def reformatter(
         Single characters that indicate a manual linebreak if leading the
         following line, i.e., even if they still fit on the previous line,
         they should be kept at the start of the next line.
+    stream (optional) : bool, default = False
+        Read, reformat and write the file line by line instead of handling the
+        full file contents in memory. The memory usage stays constant, no
+        matter how large the file is.
+    chunk_jobs (optional) : int, default = 1
+        Number of processes that reformat chunks of the file in parallel (0
+        uses all CPUs). The file is only split at empty lines and manual
+        linebreaks, such that the result is the same as for a single process.
+    chunk_size (optional) : int, default = 2**24
+        Approximate size of each chunk in bytes, if `chunk_jobs` is not 1.
+    output (optional) : str, default = None
+        Path of the new file. If not specified a new filename next to `path`
+        is used (see `new_filename`). Set it to `path` to reformat the file in
+        place. An existing file is replaced atomically once the new contents
+        are complete.
+    stats (optional) : dict, default = None
+        Fill the given dict with statistics of the run: the wall time of each
+        phase in seconds (key `time`: `read`, `tokenize`, `breaks` for the
+        detection of manual linebreaks, `wrap` including the concatenation of
+        the new lines, and `write`), the counts of `bytes`, input `lines`,
+        `tokens`, `manual_breaks` and `lines_out`. To tell the phases apart,
+        they run one after the other on the full file contents, i.e.,
+        `stream` and `chunk_jobs` have no effect.
+    profiler (optional) : object, default = None
+        A profiler with the methods `enable` and `disable`, e.g., an instance
+        of `cProfile.Profile`, which is enabled while the file is reformatted.
+    wrap_mode (optional) : str, default = 'greedy'
+        Either 'greedy', i.e., put as many words on each line as fit, or
+        'optimal', i.e., choose the linebreaks of each paragraph such that
+        its lines are as even as possible (the least sum of squared unused
+        columns, not counting the last line). Both break lines at the same
+        characters and keep manual linebreaks.
+    width_mode (optional) : str, default = 'chars'
+        Either 'chars', i.e., measure lines and words by their number of
+        characters, or 'display', i.e., by the number of columns they take up
+        on screen, where East Asian wide characters and most emoji take two
+        columns and combining characters none (see `_display_width`). This
+        applies to `ncol` and to the detection of manual linebreaks as well.
     
     Returns:
     --------
-    list[str]
-        A list of strings, where each string represents a reformatted line.
+    str
+        Path of the new file, which contains the reformatted lines.
 
     Dependencies:
     -------------
@@ -225,196 +1428,44 @@ def reformatter(
             print("continue")
     '''
 
+    if profiler is not None:
+        profiler.enable()
+        try:
+            return reformatter(path, ncol, preserve_breaks,
+                               preserve_empty_lines, breakchars, startchars,
+                               stream, chunk_jobs, chunk_size, output, stats,
+                               wrap_mode=wrap_mode, width_mode=width_mode)
+        finally:
+            profiler.disable()
+    if stats is not None:
+        return _reformat_phases(path, ncol, preserve_breaks,
+                                preserve_empty_lines, breakchars, startchars,
+                                output, stats, wrap_mode, width_mode)
+
+    if not chunk_jobs == 1:
+        return _reformat_chunks(path, ncol, preserve_breaks,
+                                preserve_empty_lines, breakchars, startchars,
+                                chunk_jobs, chunk_size, output, wrap_mode,
+                                width_mode)
+    if stream:
+        return _reformat_stream(path, ncol, preserve_breaks,
+                                preserve_empty_lines, breakchars, startchars,
+                                output, wrap_mode, width_mode)
+
     with open(path, 'r') as infile:
-        if preserve_empty_lines:
-            content = [line for line in infile]
-        else: # remove empty lines (whitespaces count as content!)
-            content = [line for line in infile if line[:-1]]
-    
-    # check last line for trailing new line character and add if not found
-    # this saves some special treatment of this line
-    if not content[-1][-1]=='\n':
-        content[-1] += '\n'
-    
-    # save each line's length
-    line_lengths = [len(line)-1 for line in content]
-    # find longest line (not counting trailing whitespaces)
-    max_len = max(line_lengths)
+        content = list(_iter_lines(infile, preserve_empty_lines))
+    if not content:
+        raise ValueError(f"nothing to reformat in '{path}'")
 
     if ncol is None:
-        ncol = max_len # not really useful if `preserve_breaks` is True
-
-    for n in range(len(content)):
-        tmp_line = []
-        word = []
-        for char in content[n]:
-            if char == ' ':
-                tmp_line.append([''.join(word), ''])
-                word = []
-            elif char in breakchars:
-                tmp_line.append([''.join(word), char])
-                word = []
-            elif char == '\n' and word:
-                tmp_line.append([''.join(word), ''])
-            else:
-                word.append(char)
-        if not tmp_line: # empty line
-            tmp_line.append(['', '\n'])
-        tmp_line.append({'old_len':line_lengths[n]})
-        content[n] = tmp_line
-    # At this point each line is a list that contains for each word a sublist.
-    # Each sublist is the current word and a str that indicates the following
-    # character after the word, e.g., '-' for a hyphen or the empty str '' for
-    # a whitespace.
-    # The line list has a dictionary as its last item, which contains the key
-    # 'old_len', that describes the length of the line before any changes.
-
-    # add the length of each word to its respective list
-    for n in range(len(content)):
-        for i in range(len(content[n])-1):
-            content[n][i].append(len(content[n][i][0]))
-    # Now each word sublist is extended by the length of each word.
-
-    # mark linebreaks as either fixed or modifiable
-    for n in range(len(content)-1):
-        try:
-            # initial line is longer than new max, i.e., should be manual break
-            if (preserve_breaks and (content[n][-1]['old_len'] > ncol)):
-                content[n][-1]['manual_break'] = True
-            # check start of next line
-            elif ((content[n+1][0][1] == '\n') # empty line
-                  or (not content[n+1][0][0] and not content[n+1][0][1]
-                      and ' ' in startchars) # whitespace & it is a startchar
-                  or (not content[n+1][0][0] and content[n+1][0][1] in
-                      startchars) # lone breakchar, which is also a startchar
-                  or (preserve_breaks and (content[n+1][0][2]
-                      + content[n][-1]['old_len'] <= ncol)) # next word ...
-                      # ... would still fit on current line
-                ):
-                content[n][-1]['manual_break'] = True
-            # Separate the case of any other leading startchar from the other
-            # conditions to underline that this is where the IndexError can
-            # occur. The order of conditions is important to catch the error
-            # properly!
-            elif (content[n+1][0][0][0] in startchars):
-                content[n][-1]['manual_break'] = True
-            else:
-                content[n][-1]['manual_break'] = False
-        # If next word is '' it has no 0th index, i.e., when trying to call
-        # `content[n+1][0][0][0]` it throws an IndexError. This is only
-        # encountered if a line starts with a whitespace, but a whitespace
-        # is not found within the startchars.
-        except IndexError:
-            content[n][-1]['manual_break'] = False
-    # for completeness add a manual_break dict key for the last line as well
-    content[-1][-1]['manual_break'] = False
-    # The trailing dictionary in each line list now also contains the key
-    # 'manual_break', which indicates whether this line is supposed to be
-    # broken there or can be rearranged.
-
-    ## The following code snippet could be avoided, by not using the dict key
-    ## 'manual_break' at all, but inserting the linebreak directly instead.
-    ## As the logic of this code changed a few times, keep this for now. It
-    ## might make sense to change this later to avoid unnecessary overhead.
-    for n in range(len(content)):
-        if ((content[n][-1]['manual_break'] is True) # detect manual linebreaks
-            and not (content[n][0][1] == '\n') # but skip empty lines
-            ):
-            # insert linebreak as last word-list in the line-list
-            content[n] = content[n][:-1] + [['','\n',0]] + [content[n][-1]]
-
-    # rearrange the lines into one large stream of word-lists (w/o the dicts)
-    content = [wlist for line in content for wlist in line[:-1]]
-
-    # check for a trailing new line & add it (if necessary) for easier handling
-    # in the next stages
-    artificial_newline = False
-    if not content[-1][1] == '\n':
-        artificial_newline = True
-        content += [['', '\n', 0]]
-
-    # apply the new length by creating lines up this respective length
-    new_content = []
-    curr_line = []
-    new_length = 0
-    while True:
-        if content: # effectively: `len(content) > 0`
-            curr_word = content.pop(0)
-        else: # content is empty
-            if curr_line: # current line contains content from the last line
-                new_content.append(curr_line)
-            break
-        if not curr_word[0]: # lone whitespace or breakchar, or new line
-            if curr_word[1] == '\n': # manual new line
-                curr_line.append(curr_word[:-1])
-                new_content.append(curr_line)
-                curr_line = []
-                new_length = 0
-                continue
-            # otherwise: lone whitespace or breakchar
-            elif new_length+1 <= ncol:
-                curr_line.append(curr_word[:-1])
-                new_length += 1
-                continue
-            else: # max allowed length would be exceeded
-                curr_line.append(['', '\n'])
-                new_content.append(curr_line)
-                curr_line = [curr_word[:-1]]
-                new_length = 1
-                continue
-        else: # the word contains at least one character
-            # word is followed by a whitespace and still fits in line
-            if not curr_word[1] and new_length+curr_word[2] <= ncol:
-                curr_line.append(curr_word[:-1])
-                new_length += curr_word[2]+1
-                continue
-            # word is followed by a breakchar and still fits in line
-            elif curr_word[1] and new_length+curr_word[2]+1 <= ncol:
-                curr_line.append(curr_word[:-1])
-                new_length += curr_word[2]+1
-                continue
-            else: # line is full
-                curr_line.append(['', '\n'])
-                new_content.append(curr_line)
-                curr_line = [curr_word[:-1]]
-                new_length = curr_word[2]+1
-                continue
-    # # remove trailing new line at the end
-    # new_content[-1] = new_content[-1][:-1]
-    # -> keep the trailing new line here for easier handling in the next stage
-
-    # concatenate word-lists into one string per line
-    for n in range(len(new_content)):
-        tmp_line = ''
-        for i,w in enumerate(new_content[n]): # i: index, w: word(-list)
-            if not w[0]: # word itself is empty
-                if w[1] == '\n': # end of current line
-                    tmp_line += w[1]
-                    new_content[n] = tmp_line
-                    break # for readability only (should be superfluous)
-                elif not w[1]: # lone whitespace
-                    tmp_line += ' '
-                    continue
-                else: # lone breakchar
-                    tmp_line += w[1]
-                    continue
-            else: # word contains at least one character
-                # current word is last in line and trailed by a whitespace
-                if new_content[n][i+1][1]=='\n' and not w[1]:
-                    tmp_line += w[0]
-                    continue
-                # word is trailed by a whitespace
-                elif not w[1]:
-                    tmp_line += w[0]+' '
-                    continue
-                # word is trailed by a breakchar
-                else:
-                    tmp_line += w[0]+w[1]
-                    continue
+        # find longest line (not counting the trailing new line character)
+        measure = _measure(width_mode)
+        ncol = max(measure(line)-1 for line in content)
+        # not really useful if `preserve_breaks` is True
 
-    # remove the very last newline-char, if it was added artificially
-    if artificial_newline:
-        new_content[-1] = new_content[-1][:-1]
+    new_content = list(_reformat_lines(
+        content, ncol, preserve_breaks, breakchars, startchars,
+        wrap_mode=wrap_mode, width_mode=width_mode))
 
     ## The whole content could be pushed into one large string, which has
     ## newline characters at the right places. However, keep it as a string per
@@ -424,38 +1475,1026 @@ def reformatter(
     ## enhancements it might be possible to write directly on a per-line basis
     ## instead of accumulating the contents and then writing these later on.
 
-    # return new_content
+    return _write_new_file(path, new_content, output)
+
+def _source_lines(source, encoding: str = 'utf-8'):
+    """ Get the lines of a str, a bytes-like buffer or an iterable of lines.
+
+    Line endings of a str or buffer are handled just like reading a file in
+    text mode, an iterable is expected to provide such lines already.
+    """
+    if isinstance(source, str):
+        return io.StringIO(source, newline=None)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return _decode_lines(source, encoding)
+    return source
+
+def iter_reformat(
+        source, ncol: int = None, preserve_breaks: bool = True,
+        preserve_empty_lines: bool = True, breakchars: list = ['-', '/'],
+        startchars: list = [' ', '-', '*', '>', '\t'],
+        encoding: str = 'utf-8', wrap_mode: str = 'greedy',
+        width_mode: str = 'chars'
+        ):
+    """Reformat a text to a given line length and generate its lines lazily.
+
+    Neither the filesystem nor the user is involved, which makes this the
+    function to embed the reformatting into other programs.
+
+    Parameters:
+    -----------
+    source : str | bytes-like | iterable of str
+        The text to reformat: either a str, a bytes-like buffer (decoded with
+        `encoding`) or an iterable of lines, e.g., an open file.
+    ncol (optional) : int, default = None
+        Number of columns after reformatting, i.e., the line length. If not
+        specified the length of the longest line of `source` is used, which
+        requires all lines to be read before the first one is generated.
+    preserve_breaks, preserve_empty_lines, breakchars, startchars (optional)
+        See `reformatter`.
+    encoding (optional) : str, default = 'utf-8'
+        Encoding of a bytes-like `source`.
+    wrap_mode, width_mode (optional) : str
+        See `reformatter`.
+
+    Returns:
+    --------
+    iterator[str]
+        The reformatted lines, each with a trailing new line character, except
+        for the last one (see `reformatter`). Nothing is generated for an
+        empty text.
+
+    Dependencies:
+    -------------
+    None
+    """
+    lines = _iter_lines(_source_lines(source, encoding), preserve_empty_lines)
+    if ncol is None:
+        lines = list(lines)
+        if not lines:
+            return iter(())
+        measure = _measure(width_mode)
+        ncol = max(measure(line)-1 for line in lines)
+    return _reformat_lines(lines, ncol, preserve_breaks, breakchars,
+                           frozenset(startchars), wrap_mode=wrap_mode,
+                           width_mode=width_mode)
+
+def reformat_text(
+        source, ncol: int = None, preserve_breaks: bool = True,
+        preserve_empty_lines: bool = True, breakchars: list = ['-', '/'],
+        startchars: list = [' ', '-', '*', '>', '\t'],
+        encoding: str = 'utf-8', wrap_mode: str = 'greedy',
+        width_mode: str = 'chars'
+        ) -> str:
+    """Reformat a text to a given line length and return it as one str.
+
+    Takes the same parameters as `iter_reformat`.
+    """
+    return ''.join(iter_reformat(source, ncol, preserve_breaks,
+                                 preserve_empty_lines, breakchars, startchars,
+                                 encoding, wrap_mode, width_mode))
+
+def reformat_batch(
+        sources, ncol: int = None, preserve_breaks: bool = True,
+        preserve_empty_lines: bool = True, breakchars: list = ['-', '/'],
+        startchars: list = [' ', '-', '*', '>', '\t'],
+        encoding: str = 'utf-8', wrap_mode: str = 'greedy',
+        width_mode: str = 'chars'
+        ) -> list:
+    """Reformat many texts with the same parameters in one call.
+
+    Takes the same parameters as `iter_reformat`, except for `sources`, which
+    is an iterable of texts, each of which is a valid `source`. The parameter
+    state (i.e., the compiled tokenizer and the set of `startchars`) is set up
+    once and reused for all texts. If `ncol` is not specified, it is set for
+    each text separately. Returns a list with one reformatted str per text.
+    """
+    breakchars = tuple(breakchars)
+    startchars = frozenset(startchars)
+    _compile_tokenizer(breakchars)
+    return [reformat_text(source, ncol, preserve_breaks, preserve_empty_lines,
+                          breakchars, startchars, encoding, wrap_mode,
+                          width_mode)
+            for source in sources]
+
+def _check_greedy(
+        text: str, ncol: int = None, preserve_breaks: bool = True,
+        preserve_empty_lines: bool = True, breakchars: list = ['-', '/'],
+        startchars: list = [' ', '-', '*', '>', '\t']
+        ) -> bool:
+    """ Tell whether the greedy wrap would leave a text as it is, if simple.
+
+    Returns `True` or `False`, or `None` if the answer needs the wrap itself
+    (see `_check_file`). A text is simple if its lines fit into `ncol`, none of
+    them starts with a separator (a whitespace or a breakchar) and no two
+    separators follow each other. Each line of such a text is reproduced as it
+    is by a wrap that starts with it. Thus, it is enough to check that the
+    first word of the following line does not fit onto the line as well,
+    unless there is a manual linebreak. With `preserve_breaks` that is always
+    the case, as a line that could take the next word counts as manually
+    broken. Apart from that, only the last line must not end with a new line
+    character (see `_wrap_lines`), unless it is an empty line.
+    """
+    seps = ''.join(c for c in breakchars if len(c) == 1 and not c == ' ')
+    if not text or '\n' in seps:
+        return None
+    lines = text.split('\n')
+    if not lines[-1]: # the text ends with a new line character
+        lines.pop()
+        if lines[-1]:
+            return False
+    if not preserve_empty_lines:
+        if '' in lines:
+            return None
+        if not text.endswith('\n') and len(lines[-1]) == 1:
+            # taken for an empty line (see `_iter_lines`), which leaves
+            # nothing to reformat in a text of a single line
+            return None if len(lines) == 1 else False
+    if ncol is not None and max(map(len, lines)) > ncol:
+        return None
+    # substrings are found much faster than any regex with character sets
+    spaced = text.translate(str.maketrans(seps, ' '*len(seps)))
+    if (spaced.startswith(' ') or '\n ' in spaced or '  ' in spaced
+            or text.endswith(' ') or ' \n' in text):
+        return None
+    if preserve_breaks:
+        return True
+
+    if ncol is None:
+        ncol = max(map(len, lines))
+    pattern = '[ '+re.escape(seps)+']'
+    first = re.compile(f'[^ {re.escape(seps)}]*{pattern}?').match
+    for line, next_line in zip(lines, lines[1:]):
+        if not line or not next_line or next_line[0] in startchars:
+            continue # a manual linebreak
+        # the first word and its trailing breakchar, if any
+        size = first(next_line).end()
+        if next_line[size-1:size] == ' ':
+            size -= 1
+        if len(line) + (0 if line[-1] in seps else 1) + size <= ncol:
+            return False
+    return True
+
+def _check_file(
+        path: str, ncol: int = None, preserve_breaks: bool = True,
+        preserve_empty_lines: bool = True, breakchars: list = ['-', '/'],
+        startchars: list = [' ', '-', '*', '>', '\t'],
+        wrap_mode: str = 'greedy', width_mode: str = 'chars',
+        diff: bool = False, **kwargs
+        ) -> str:
+    """ Check whether reformatting a file would change it, without writing.
+
+    Takes the same parameters as `reformatter`, where those about the output
+    (e.g., `output` or `stream`) have no effect. The reformatted lines are
+    compared with the lines of the file while they are generated, i.e., with
+    the one-line lookahead of `_reformat_stream`, and the check stops at the
+    first difference. Most files are checked without any wrap at all in the
+    'greedy' `wrap_mode` though (see `_check_greedy`), unless they contain
+    characters other than ASCII in the 'display' `width_mode`. Returns `None`
+    if the file would stay the same, otherwise an empty str, or the unified
+    diff if `diff` is set (in which case the whole file is reformatted).
+    """
+    if wrap_mode == 'greedy' and not diff:
+        with open(path, 'r') as infile:
+            text = infile.read()
+            newlines = infile.newlines
+        same = None
+        if width_mode == 'chars' or text.isascii():
+            same = _check_greedy(text, ncol, preserve_breaks,
+                                 preserve_empty_lines, breakchars, startchars)
+        if same is not None:
+            # the new file gets the new lines of the platform (see `open`)
+            return None if same and newlines in (None, os.linesep) else ''
+        del text
+
+    if ncol is None:
+        measure = _measure(width_mode)
+        with open(path, 'r') as infile:
+            ncol = max((measure(line)-1 for line in
+                        _iter_lines(infile, preserve_empty_lines)),
+                       default=None)
+
+    with open(path, 'r') as infile:
+        old, lines = itertools.tee(infile)
+        lines = _iter_lines(lines, preserve_empty_lines)
+        first = next(lines, None)
+        if first is None:
+            raise ValueError(f"nothing to reformat in '{path}'")
+        new = _reformat_lines(itertools.chain([first], lines), ncol,
+                              preserve_breaks, breakchars, startchars,
+                              wrap_mode=wrap_mode, width_mode=width_mode)
+        if diff:
+            old, new = list(old), list(new)
+            changed = not old == new
+        else:
+            changed = (any(not line == next(old, None) for line in new)
+                       or next(old, None) is not None)
+        # the new file gets the new lines of the platform (see `open`)
+        newlines = infile.newlines
+    if not changed and newlines in (None, os.linesep):
+        return None
+    if not diff:
+        return ''
+    if not changed:
+        return f"Line endings of {path} would change to {os.linesep!r}\n"
+    return ''.join(line if line.endswith('\n') else
+                   line + '\n\\ No newline at end of file\n'
+                   for line in difflib.unified_diff(
+                       old, new, path, path + ' (reformatted)'))
+
+## Cache
+# The cache is an SQLite database, such that several processes can share it
+# safely. The table `files` maps the stat signature of each input file to the
+# hash of its contents, i.e., an unchanged file is never read to get its hash.
+# The table `outputs` notes for each input file, content hash and parameter set
+# the file that was written for it. A file is skipped, if such a file still
+# exists unchanged. The table `blocks` maps the hash of a few consecutive
+# paragraphs (see `_split_paragraphs`) and the parameters to their wrapped
+# lines, such that only the changed paragraphs of an edited file are wrapped
+# again.
+_CACHE_VERSION = 1 # increase to invalidate all entries, e.g., on new output
+_CACHE_CONNECTIONS = {} # one connection per cache and process
+_BLOCK_PARAGRAPHS = 16 # average number of paragraphs per cached block
+
+def _file_digest(path: str, blocksize: int = 2**20) -> str:
+    """ Compute the SHA-256 hash of a file's contents. """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as infile:
+        for block in iter(lambda: infile.read(blocksize), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _params_key(
+        ncol: int = None, preserve_breaks: bool = True,
+        preserve_empty_lines: bool = True, breakchars: list = ['-', '/'],
+        startchars: list = [' ', '-', '*', '>', '\t'],
+        wrap_mode: str = 'greedy', width_mode: str = 'chars', **kwargs
+        ) -> str:
+    """ Build a key for all parameters that have an effect on the output.
+
+    Further keyword arguments (e.g., `stream`) do not change the output and
+    are ignored.
+    """
+    return json.dumps([_CACHE_VERSION, ncol, preserve_breaks,
+                       preserve_empty_lines, sorted(set(breakchars)),
+                       sorted(set(startchars)), wrap_mode, width_mode])
+
+def _cache_connect(cache_path: str) -> sqlite3.Connection:
+    """ Open (and set up) the cache database, once per process. """
+    db = _CACHE_CONNECTIONS.get(cache_path)
+    if db is None:
+        # autocommit, as each statement is a transaction of its own anyway
+        db = sqlite3.connect(cache_path, timeout=60, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, "
+                   "size INTEGER, mtime_ns INTEGER, inode INTEGER, "
+                   "digest TEXT, used REAL)")
+        db.execute("CREATE TABLE IF NOT EXISTS outputs (path TEXT, "
+                   "params TEXT, digest TEXT, output TEXT, size INTEGER, "
+                   "mtime_ns INTEGER, used REAL, "
+                   "PRIMARY KEY (path, params, digest))")
+        db.execute("CREATE TABLE IF NOT EXISTS blocks (key TEXT PRIMARY "
+                   "KEY, output TEXT, used REAL)")
+        _CACHE_CONNECTIONS[cache_path] = db
+    return db
+
+def _cache_digest(db: sqlite3.Connection, path: str) -> str:
+    """ Get the hash of a file, which is only computed if the file changed.
+
+    Either way the entry of the file counts as used now (see `_cache_evict`).
+    """
+    st = os.stat(path)
+    row = db.execute("SELECT size, mtime_ns, inode, digest FROM files "
+                     "WHERE path = ?", (path,)).fetchone()
+    if row is not None and row[:3] == (st.st_size, st.st_mtime_ns, st.st_ino):
+        db.execute("UPDATE files SET used = ? WHERE path = ?",
+                   (time.time(), path))
+        return row[3]
+    digest = _file_digest(path)
+    db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+               (path, st.st_size, st.st_mtime_ns, st.st_ino, digest,
+                time.time()))
+    return digest
+
+def _reformat_incremental(
+        path: str, ncol: int, cache_path: str, preserve_breaks: bool = True,
+        preserve_empty_lines: bool = True, breakchars: list = ['-', '/'],
+        startchars: list = [' ', '-', '*', '>', '\t'], output: str = None,
+        stats: dict = None, wrap_mode: str = 'greedy',
+        width_mode: str = 'chars', **kwargs
+        ) -> str:
+    """ Reformat a file, but only wrap paragraphs the cache does not know.
+
+    The lines are split into paragraphs at hard breaks (see
+    `_split_paragraphs`), which are grouped into blocks of a few paragraphs.
+    The wrapped lines of each block are looked up by its hash and the
+    parameters, only the remaining blocks are wrapped and then added to the
+    cache. Returns the path of the new file, which is identical to the output
+    of `reformatter`. If a dict `stats` is given, the time per phase and some
+    counters are noted in it (see `reformatter`).
+    """
+    start = time.perf_counter()
+    with open(path, 'r') as infile:
+        content = list(_iter_lines(infile, preserve_empty_lines))
+    if not content:
+        raise ValueError(f"nothing to reformat in '{path}'")
+    if ncol is None:
+        measure = _measure(width_mode)
+        ncol = max(measure(line)-1 for line in content)
+    start = _lap(stats, 'read', start)
 
-    with open(new_filename(path), 'a') as outfile:
-        for line in new_content:
-            outfile.write(line)
+    # A block ends after each paragraph whose checksum is a multiple of
+    # `_BLOCK_PARAGRAPHS`, such that an edit moves no other block boundaries.
+    blocks = [[]]
+    texts = [[]]
+    for paragraph in _split_paragraphs(content, ncol, preserve_breaks,
+                                       breakchars, startchars, width_mode):
+        text = ''.join(paragraph).encode()
+        blocks[-1].extend(paragraph)
+        texts[-1].append(text)
+        if zlib.crc32(text) % _BLOCK_PARAGRAPHS == 0:
+            blocks.append([])
+            texts.append([])
+    if not blocks[-1]:
+        del blocks[-1], texts[-1]
+
+    params = _params_key(ncol, preserve_breaks, preserve_empty_lines,
+                         breakchars, startchars, wrap_mode, width_mode)
+    keys = []
+    for n, text in enumerate(texts):
+        # the last block has no hard break at its end
+        digest = hashlib.sha256(f"{params}{n == len(texts)-1:d}".encode())
+        for part in text:
+            digest.update(part)
+        keys.append(digest.hexdigest())
+    start = _lap(stats, 'split', start)
+
+    db = _cache_connect(cache_path)
+    known = {}
+    unique = list(set(keys))
+    for n in range(0, len(unique), 500): # stay below SQLite's variable limit
+        batch = unique[n:n+500]
+        known.update(db.execute(
+            "SELECT key, output FROM blocks WHERE key IN "
+            f"({','.join('?'*len(batch))})", batch))
+
+    start = _lap(stats, 'lookup', start)
+
+    wrapped = []
+    new = {}
+    for n, (key, block) in enumerate(zip(keys, blocks)):
+        text = known.get(key, new.get(key))
+        if text is None:
+            text = new[key] = ''.join(_reformat_lines(
+                block, ncol, preserve_breaks, breakchars, startchars,
+                last_break=not n == len(blocks)-1, wrap_mode=wrap_mode,
+                width_mode=width_mode))
+        wrapped.append(text)
+    start = _lap(stats, 'wrap', start)
+    new_path = _write_new_file(path, wrapped, output)
+    start = _lap(stats, 'write', start)
+
+    now = time.time()
+    db.execute("BEGIN")
+    try:
+        db.executemany("INSERT OR REPLACE INTO blocks VALUES (?, ?, ?)",
+                       ((key, text, now) for key, text in new.items()))
+        db.executemany("UPDATE blocks SET used = ? WHERE key = ?",
+                       ((now, key) for key in known))
+    except BaseException:
+        db.execute("ROLLBACK")
+        raise
+    db.execute("COMMIT")
+    _lap(stats, 'store', start)
+    if stats is not None:
+        stats.update(bytes=os.path.getsize(path), lines=len(content),
+                     blocks=len(blocks), blocks_wrapped=len(new))
+    return new_path
+
+def _reformat_cached(
+        path: str, ncol: int, cache_path: str, incremental: bool = False,
+        **kwargs
+        ) -> str:
+    """ Reformat a file, unless the cache knows its output exists already.
+
+    Takes the same parameters as `reformatter` and additionally the path to
+    the cache database. If `incremental` is set, a changed file is reformatted
+    by `_reformat_incremental` instead of `reformatter`. Returns the path of
+    the new file, or `None` if the file is skipped. A file is not skipped if
+    its output is asked for at another path than the known one.
+    """
+    db = _cache_connect(cache_path)
+    key = os.path.abspath(path)
+    digest = _cache_digest(db, key)
+    params = _params_key(ncol, **kwargs)
+    row = db.execute("SELECT output, size, mtime_ns FROM outputs WHERE "
+                     "path = ? AND params = ? AND digest = ?",
+                     (key, params, digest)).fetchone()
+    output = kwargs.get('output')
+    if row is not None and (output is None
+                            or os.path.abspath(output) == row[0]):
+        try:
+            st = os.stat(row[0])
+        except OSError: # the output was removed
+            pass
+        else:
+            if (st.st_size, st.st_mtime_ns) == row[1:]:
+                db.execute("UPDATE outputs SET used = ? WHERE path = ? AND "
+                           "params = ? AND digest = ?",
+                           (time.time(), key, params, digest))
+                return None
+
+    if incremental:
+        new_path = _reformat_incremental(path, ncol, cache_path, **kwargs)
+    else:
+        new_path = reformatter(path, ncol, **kwargs)
+    st = os.stat(new_path)
+    db.execute("INSERT OR REPLACE INTO outputs VALUES (?, ?, ?, ?, ?, ?, ?)",
+               (key, params, digest, os.path.abspath(new_path), st.st_size,
+                st.st_mtime_ns, time.time()))
+    return new_path
+
+def _cache_evict(cache_path: str, max_entries: int):
+    """ Remove the least recently used entries beyond `max_entries`.
+
+    The limit applies to each table on its own.
+    """
+    db = _cache_connect(cache_path)
+    for table in ('files', 'outputs', 'blocks'):
+        db.execute(f"DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM "
+                   f"{table} ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                   (max_entries,))
+
+## Overlapped I/O
+# Many small files spend much of their time waiting for reads and writes. The
+# files ahead are read and the finished files are written on a pool of threads
+# while the main thread wraps, which needs the GIL anyway.
+
+def _read_bytes(path: str) -> bytes:
+    """ Read the whole file `path` in binary mode. """
+    with open(path, 'rb') as infile:
+        return infile.read()
+
+def _reformat_bytes(
+        path: str, data: bytes, ncol: int, encoding: str,
+        preserve_breaks: bool = True, preserve_empty_lines: bool = True,
+        breakchars: list = ['-', '/'],
+        startchars: list = [' ', '-', '*', '>', '\t'],
+        wrap_mode: str = 'greedy', width_mode: str = 'chars', **kwargs
+        ) -> bytes:
+    """ Reformat the contents `data` of the file `path` like `reformatter`.
+
+    `data` is decoded with `encoding` and its line endings are translated
+    just like by reading the file in text mode, and the new contents are
+    encoded just like by writing in text mode. Other keyword arguments (i.e.,
+    the ones of `reformatter` that do not apply here) are ignored.
+    """
+    content = list(_iter_lines(_source_lines(data.decode(encoding)),
+                               preserve_empty_lines))
+    if not content:
+        raise ValueError(f"nothing to reformat in '{path}'")
+    if ncol is None:
+        measure = _measure(width_mode)
+        ncol = max(measure(line)-1 for line in content)
+    text = ''.join(_reformat_lines(
+        content, ncol, preserve_breaks, breakchars, startchars,
+        wrap_mode=wrap_mode, width_mode=width_mode))
+    if not os.linesep == '\n':
+        text = text.replace('\n', os.linesep)
+    return text.encode(encoding)
+
+def _reformat_overlapped(
+        files: list, io_threads: int = 4, io_bytes: int = 2**26,
+        stop_on_error: bool = False, encoding: str = None, **kwargs
+        ) -> list:
+    """ Reformat several files in this process with overlapped reads/writes.
+
+    Same as `_reformat_files` with `reformatter` and a single job, but the
+    files ahead are read and the finished files are written on a pool of
+    `io_threads` threads, while this thread wraps. The new filename of a file
+    without an output path is chosen before the file is written, taking the
+    new files of the files before it into account. The files are read and
+    written in binary mode as a whole and are decoded and encoded with
+    `encoding` (default: the same as for `open`). The read inputs and
+    unwritten outputs held in memory are limited to about `io_bytes` bytes,
+    but one file is always read regardless of its size. A file that is the
+    output of an earlier file is only read once that output is written, and
+    the outputs to the same path are written in order. With `stop_on_error`
+    each file is written before the next one is wrapped, such that no file
+    after the first error is written.
+    """
+    if encoding is None:
+        encoding = locale.getpreferredencoding(False)
+    results = []
+    reads = collections.deque()  # (path, ncol, output, size, future)
+    writes = collections.deque()  # (index in results, target, size, future)
+    held = 0  # bytes of read inputs and unwritten outputs
+    unwritten = collections.Counter()  # outputs of files read and not written
+    listings = {}  # directory -> names of the files in it, including new ones
+    upcoming = iter(files)
+    ahead = next(upcoming, None)
+
+    def finish_write():
+        nonlocal held
+        index, target, size, future = writes.popleft()
+        held -= size
+        unwritten[target] -= 1
+        try:
+            results[index] = (results[index][0], future.result(), None)
+        except Exception as error:
+            results[index] = (results[index][0], None, error)
+        return results[index][2] is None
+
+    with ThreadPoolExecutor(max_workers=io_threads) as pool:
+        try:
+            while reads or ahead is not None:
+                # read ahead up to the limits, but at least the next file
+                while ahead is not None and len(reads) < 4*io_threads:
+                    if unwritten[os.path.abspath(ahead[0])] > 0:
+                        if reads:
+                            break
+                        while writes:
+                            finish_write()
+                    try:
+                        size = os.path.getsize(ahead[0])
+                    except OSError:
+                        size = 0  # the read reports the error
+                    if reads and held + size > io_bytes:
+                        break
+                    reads.append((*ahead, size,
+                                  pool.submit(_read_bytes, ahead[0])))
+                    held += size
+                    if ahead[2] is not None:
+                        unwritten[os.path.abspath(ahead[2])] += 1
+                    ahead = next(upcoming, None)
+                path, ncol, output, size, future = reads.popleft()
+                try:
+                    data = _reformat_bytes(path, future.result(), ncol,
+                                           encoding, **kwargs)
+                except Exception as error:
+                    if output is not None:
+                        unwritten[os.path.abspath(output)] -= 1
+                    results.append((path, None, error))
+                    if stop_on_error:
+                        break
+                    continue
+                finally:
+                    held -= size
+                if output is None:
+                    directory = os.path.dirname(path)
+                    if directory not in listings:
+                        listings[directory] = set(os.listdir(directory or '.'))
+                    output = new_filename(path, listings[directory])
+                    unwritten[os.path.abspath(output)] += 1
+                target = os.path.abspath(output)
+                # backpressure: wait for earlier writes to free memory, and
+                # for an earlier output to the same path
+                while writes and (held + len(data) > io_bytes
+                                  or unwritten[target] > 1):
+                    finish_write()
+                results.append((path, None, None))
+                writes.append((len(results)-1, target, len(data),
+                               pool.submit(_write_new_file, path, [data],
+                                           output, True)))
+                held += len(data)
+                if stop_on_error and not finish_write():
+                    break
+            while writes:
+                finish_write()
+        finally:
+            for *_, future in reads:
+                future.cancel()
+    return results
+
+def _try_reformat(func, path: str, ncol: int, output: str, kwargs: dict):
+    """ Call `func` for one file and return `(path, result, error)`. """
+    try:
+        return path, func(path, ncol, output=output, **kwargs), None
+    except Exception as error:
+        return path, None, error
+
+def _reformat_files(
+        files: list, jobs: int = 1, func=reformatter,
+        stop_on_error: bool = False, io_threads: int = 0, **kwargs
+        ) -> list:
+    """ Reformat several files, optionally on a pool of processes.
+
+    Each item of `files` is a tuple of one path, one ncol and one output path
+    (or `None`, see `reformatter`), any other keyword argument is passed on to
+    `func` (`reformatter` or a function with the same parameters). Returns a
+    list of tuples `(path, result, error)` in the same order as `files`,
+    where `result` is the return value of `func` and `error` is `None` for a
+    successfully reformatted file. An error for one file does not stop the
+    others from being reformatted, unless `stop_on_error` is set, in which
+    case the list ends with the first error. With `io_threads` and a single
+    job, `reformatter` reads and writes the files on as many threads while
+    the next file is wrapped (see `_reformat_overlapped`), unless the files
+    are streamed or split into chunks.
+    """
+    if (io_threads and jobs == 1 and func is reformatter and len(files) > 1
+            and not kwargs.get('stream')
+            and kwargs.get('chunk_jobs', 1) == 1):
+        return _reformat_overlapped(files, io_threads,
+                                    stop_on_error=stop_on_error, **kwargs)
+    args_list = ((func, path, ncol, output, kwargs)
+                 for path, ncol, output in files)
+    results = []
+    if jobs != 1 and len(files) > 1:
+        workers = jobs or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # gather in the order of submission, not of completion
+            for result in _imap_ordered(executor, _try_reformat, args_list,
+                                        4*workers):
+                results.append(result)
+                if stop_on_error and result[2] is not None:
+                    break
+        return results
+    for args in args_list:
+        results.append(_try_reformat(*args))
+        if stop_on_error and results[-1][2] is not None:
+            break
+    return results
+
+def _reformat_stats(path: str, ncol: int, reformat=reformatter, **kwargs):
+    """ Call `reformat` with a new stats dict and return `(result, stats)`.
+
+    `reformat` is `reformatter` or a function with the same parameters. The
+    total wall time is added to the stats.
+    """
+    stats = {}
+    start = time.perf_counter()
+    result = reformat(path, ncol, stats=stats, **kwargs)
+    _lap(stats, 'total', start)
+    return result, stats
+
+def _aggregate_stats(stats_list: list) -> dict:
+    """ Sum up the stats of several files. """
+    total = {'files': len(stats_list), 'time': {}}
+    for stats in stats_list:
+        for key, value in stats.items():
+            if key == 'time':
+                for phase, seconds in value.items():
+                    total['time'][phase] = (total['time'].get(phase, 0)
+                                            + seconds)
+            else:
+                total[key] = total.get(key, 0) + value
+    return total
+
+def _format_stats(name: str, stats: dict) -> str:
+    """ Describe stats (see `reformatter`) in one line of text. """
+    times = dict(stats.get('time', {}))
+    text = f"{name}: {times.pop('total', 0):.3f} s"
+    if times:
+        text += " (" + ", ".join(f"{phase} {seconds:.3f} s"
+                                 for phase, seconds in times.items()) + ")"
+    for key, value in stats.items():
+        if key == 'peak_memory':
+            # unknown without the `resource` module, e.g., on Windows
+            text += (", peak memory n/a" if value is None
+                     else f", peak memory {value/2**20:.1f} MB")
+        elif not key == 'time':
+            text += f", {value} {key.replace('_', ' ')}"
+    return text
+
+## Server
+# A long-running process that reformats on request, such that frequent small
+# jobs (e.g., from an editor) do not pay for the interpreter startup and the
+# parameter setup each time. Clients connect to a Unix domain socket and send
+# one JSON object per line, each of which is answered by one JSON object per
+# line (see `reformat_client.py` for a thin client):
+#   {"text": "...", "ncol": 72, ...}        -> {"ok": true, "text": "..."}
+#   {"path": "/abs/path", "ncol": 72, ...}  -> {"ok": true, "path": "..."}
+#   {"op": "ping"} or {"op": "shutdown"}    -> {"ok": true}
+# Any failure is answered with {"ok": false, "error": "..."} instead. Each
+# connection is handled in its own thread, the server stops on the shutdown
+# request, SIGTERM or SIGINT, or once it was idle for `idle_timeout` seconds.
+_SERVER_PARAMS = ('ncol', 'preserve_breaks', 'preserve_empty_lines',
+                  'breakchars', 'startchars', 'wrap_mode', 'width_mode',
+                  'stream')
+
+@functools.lru_cache(maxsize=256)
+def _server_params(breakchars: tuple, startchars: tuple) -> tuple:
+    """ Set up the parameter state once per set of breakchars and startchars.
+
+    Returns the breakchars and startchars in the form that the wrapping engine
+    uses, with the tokenizer for the breakchars compiled already.
+    """
+    _compile_tokenizer(breakchars)
+    return breakchars, frozenset(startchars)
+
+def _serve_request(request: dict) -> dict:
+    """ Answer one request (see `## Server`), except for the shutdown. """
+    request = dict(request)
+    op = request.pop('op', 'reformat')
+    if op == 'ping':
+        return {'ok': True}
+    if not op == 'reformat':
+        raise ValueError(f"unknown op '{op}'")
+    text = request.pop('text', None)
+    path = request.pop('path', None)
+    output = request.pop('output', None)
+    if (text is None) == (path is None):
+        raise ValueError("expected either 'text' or 'path'")
+    unknown = sorted(set(request) - set(_SERVER_PARAMS))
+    if unknown:
+        raise ValueError(f"unknown parameters: {', '.join(unknown)}")
+    if 'breakchars' in request or 'startchars' in request:
+        request['breakchars'], request['startchars'] = _server_params(
+            tuple(request.get('breakchars', ['-', '/'])),
+            tuple(request.get('startchars', [' ', '-', '*', '>', '\t'])))
+    if text is not None:
+        request.pop('stream', None)
+        return {'ok': True, 'text': reformat_text(text, **request)}
+    if not os.path.isabs(path) or not (output is None
+                                       or os.path.isabs(output)):
+        raise ValueError("expected absolute paths")
+    return {'ok': True, 'path': reformatter(path, output=output, **request)}
+
+class _ReformatHandler(socketserver.StreamRequestHandler):
+    """ Answer the requests of one connection in order. """
+
+    def handle(self):
+        for line in self.rfile:
+            self.server.enter()
+            try:
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("expected a JSON object")
+                    if request.get('op') == 'shutdown':
+                        self.server.stopping = True
+                        response = {'ok': True}
+                    else:
+                        response = _serve_request(request)
+                except Exception as error:
+                    response = {'ok': False,
+                                'error': f"{type(error).__name__}: {error}"}
+                self.wfile.write(json.dumps(response).encode() + b'\n')
+            finally:
+                self.server.leave()
+
+# not available on Windows, where `_serve` fails on the missing AF_UNIX
+_UnixStreamServer = getattr(socketserver, 'UnixStreamServer', object)
+
+class _ReformatServer(socketserver.ThreadingMixIn, _UnixStreamServer):
+    """ Unix domain socket server that handles each connection in a thread.
+
+    Counts the requests in progress and notes the time of the last one, such
+    that `_serve` can tell when it is idle.
+    """
+    daemon_threads = True # open, but idle connections do not block the exit
+
+    def __init__(self, socket_path: str, idle_timeout: float = None):
+        super().__init__(socket_path, _ReformatHandler)
+        self.idle_timeout = idle_timeout
+        self.stopping = False
+        self.active = 0
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def enter(self):
+        with self.lock:
+            self.active += 1
+
+    def leave(self):
+        with self.lock:
+            self.active -= 1
+            self.last = time.monotonic()
+
+    def idle(self) -> bool:
+        """ Tell whether no request came in for longer than the timeout. """
+        with self.lock:
+            return (self.idle_timeout is not None and self.active == 0
+                    and time.monotonic() - self.last > self.idle_timeout)
+
+def _serve(socket_path: str, idle_timeout: float = 600.0,
+           poll_interval: float = 0.5, drain_timeout: float = 60.0):
+    """ Run a reformat server on a Unix domain socket until it is stopped.
+
+    A stale socket file of a server that is gone is replaced, while a running
+    server, or any other file at `socket_path`, raises a `FileExistsError`.
+    Only the current user can connect. On shutdown no new connections are
+    accepted, the requests in progress may take up to `drain_timeout` seconds
+    to finish, and the socket file is removed. `idle_timeout` can be `None` to
+    never stop when idle.
+    """
+    if os.path.exists(socket_path):
+        if not stat.S_ISSOCK(os.stat(socket_path).st_mode):
+            raise FileExistsError(f"'{socket_path}' exists and is no socket")
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(socket_path)
+        except ConnectionRefusedError: # left behind by a server that is gone
+            os.remove(socket_path)
+        else:
+            raise FileExistsError(f"a server is running on '{socket_path}'")
+        finally:
+            probe.close()
+    umask = os.umask(0o077) # the socket is never open to others
+    try:
+        server = _ReformatServer(socket_path, idle_timeout)
+    finally:
+        os.umask(umask)
+    server.timeout = poll_interval
+    handlers = {}
+    def stop(signum, frame):
+        server.stopping = True
+    try:
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            handlers[signum] = signal.signal(signum, stop)
+        while not server.stopping and not server.idle():
+            server.handle_request() # returns after `poll_interval` at latest
+        deadline = time.monotonic() + drain_timeout
+        while server.active and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        for signum, handler in handlers.items():
+            signal.signal(signum, handler)
+        server.server_close()
+        os.remove(socket_path)
 
 def main():
     """ main (module wrapper) """
 
     args = get_cmd_line_args()
 
-    check_paths(args.paths)
+    if args.serve is not None:
+        try:
+            _serve(args.serve, args.idle_timeout or None)
+        except OSError as error:
+            print(f"Failed to serve on {args.serve}: {type(error).__name__}: "
+                  f"{error}", file=sys.stderr)
+            return 1
+        return 0
+
+    if args.paths in ([], ['-']): # a filter from stdin to stdout
+        try:
+            _reformat_pipe(
+                sys.stdin,
+                sys.stdout,
+                ncol = args.ncol[0] if args.ncol else None,
+                preserve_breaks = not args.ignore_manual_breaks,
+                preserve_empty_lines = not args.remove_empty_lines,
+                breakchars = args.breakchars,
+                startchars = args.startchars,
+                wrap_mode = args.wrap_mode,
+                width_mode = args.width_mode
+            )
+        except BrokenPipeError: # the consumer stopped reading, e.g., `head`
+            # avoid another error when Python flushes stdout at exit
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+            return 1
+        return 0
 
-    ncols = [args.ncol]*len(args.paths)
+    ncols = args.ncol if args.ncol else [None]
+    if len(ncols) == 1:
+        ncols = ncols*len(args.paths)
     paths_ncols = list(zip(args.paths, ncols))
-    ## `path_ncol` contains tuples of one filename and one ncol. This is used
-    ## instead of applying the single ncol directly, in order to enable an
-    ## easier modification, in case ncol is supposed to be optionally a list of
-    ## different numbers (one for each path). Then, only the line that creates
-    ## `ncols` needs to be modified, but other code still works just fine.
-
-    for path_ncol in paths_ncols:
-        reformatter(
-            path = path_ncol[0],
-            ncol = path_ncol[1],
-            preserve_breaks = not args.ignore_manual_breaks,
-            preserve_empty_lines = not args.remove_empty_lines,
-            breakchars = args.breakchars,
-            startchars = args.startchars
-        )
+    ## `path_ncol` contains tuples of one filename and one ncol, such that
+    ## `--ncol` can be either a single number or a list of different numbers
+    ## (one for each path).
+
+    valid_paths = check_paths(args.paths, args.on_error)
+    if valid_paths is None:
+        return 1
+    paths_ncols = [pn for pn in paths_ncols if pn[0] in valid_paths]
+
+    ## Directories are replaced by the files found within. Each file comes
+    ## with the path of its new file: mirrored within the output directory
+    ## (below the name of the directory that was searched), the file itself
+    ## (in place) or `None` (next to the file, see `new_filename`).
+    def output_path(path, relpath):
+        if args.in_place:
+            return path
+        if args.output_dir is not None:
+            return os.path.join(args.output_dir, relpath)
+        return None
+
+    scan_errors = []
+    def onerror(error):
+        if args.on_error == 'abort':
+            raise error
+        scan_errors.append((error.filename, error))
+
+    skip = set()
+    if args.output_dir is not None: # never search the output itself
+        skip.add(os.path.abspath(args.output_dir))
+    files = []
+    try:
+        for path, ncol in paths_ncols:
+            if not os.path.isdir(path):
+                files.append((path, ncol,
+                              output_path(path, os.path.basename(path))))
+                continue
+            root = os.path.basename(os.path.abspath(path))
+            for file, relpath in _scan_tree(path, args.include, args.exclude,
+                                            skip, onerror):
+                files.append((file, ncol,
+                              output_path(file, os.path.join(root, relpath))))
+    except OSError as error:
+        print(f"Failed to search {error.filename}: {type(error).__name__}: "
+              f"{error}", file=sys.stderr)
+        return 1
+    ## Files that would overwrite each other's output are not reformatted,
+    ## but reported as failures. With `--on_error abort` nothing is written.
+    collisions = _output_collisions(files)
+    if collisions and args.on_error == 'abort':
+        todo = []
+    else:
+        todo = [file for index, file in enumerate(files)
+                if index not in collisions]
+    if args.output_dir is not None:
+        for directory in {os.path.dirname(output) for _, _, output in todo}:
+            os.makedirs(directory, exist_ok=True)
+
+    kwargs = {}
+    if args.check:
+        kwargs = {'func': _check_file, 'diff': args.diff}
+    if args.cache is not None:
+        kwargs = {'func': _reformat_cached, 'cache_path': args.cache,
+                  'incremental': args.incremental}
+    if args.stats:
+        kwargs = {'func': _reformat_stats,
+                  'reformat': kwargs.pop('func', reformatter), **kwargs}
+    if args.profile is not None:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    results = _reformat_files(
+        todo,
+        jobs = args.jobs,
+        io_threads = args.io_threads,
+        stop_on_error = args.on_error == 'abort',
+        **kwargs,
+        preserve_breaks = not args.ignore_manual_breaks,
+        preserve_empty_lines = not args.remove_empty_lines,
+        breakchars = args.breakchars,
+        startchars = args.startchars,
+        stream = args.stream,
+        chunk_jobs = args.chunk_jobs,
+        wrap_mode = args.wrap_mode,
+        width_mode = args.width_mode
+    )
+    if args.profile is not None:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+    if collisions and todo: # back in the order of the given paths
+        done = iter(results)
+        results = [(path, None, collisions[index]) if index in collisions
+                   else next(done) for index, (path, _, _) in enumerate(files)]
+    elif collisions: # nothing was reformatted
+        results = [(files[index][0], None, error)
+                   for index, error in sorted(collisions.items())]
+    if args.stats:
+        file_stats = [(path, result[1]) for path, result, error in results
+                      if error is None]
+        results = [(path, None if error else result[0], error)
+                   for path, result, error in results]
+
+    if args.cache is not None:
+        _cache_evict(args.cache, args.cache_size)
+        skipped = sum(1 for _, result, error in results
+                      if result is None and error is None)
+        if skipped:
+            print(f"Skipped {skipped} of {len(results)} files (output "
+                  f"already known from the cache).")
+
+    if args.stats:
+        total = _aggregate_stats([stats for _, stats in file_stats])
+        # only known for the whole run (see `_peak_memory`)
+        total['peak_memory'] = _peak_memory()
+        if args.stats_format == 'json':
+            print(json.dumps({'files': [dict(path=path, **stats) for
+                                        path, stats in file_stats],
+                              'total': total}, indent=2), file=sys.stderr)
+        else:
+            for path, stats in file_stats:
+                print(_format_stats(path, stats), file=sys.stderr)
+            print(_format_stats(f"total ({total.pop('files')} files)",
+                                total), file=sys.stderr)
+
+    changed = []
+    if args.check:
+        changed = [(path, result) for path, result, error in results
+                   if error is None and result is not None]
+        for path, diff in changed:
+            print(diff if args.diff else path, end='' if args.diff else '\n')
+        if changed:
+            print(f"{len(changed)} of {len(results)} files would be "
+                  f"reformatted.", file=sys.stderr)
 
-    return
+    if scan_errors:
+        print(f"Failed to search {len(scan_errors)} directories:",
+              file=sys.stderr)
+        for path, error in scan_errors:
+            print(f" {path}: {type(error).__name__}: {error}", file=sys.stderr)
+    failed = [(path, error) for path, _, error in results if error is not None]
+    if failed:
+        print(f"Failed to reformat {len(failed)} of {len(results)} files:",
+              file=sys.stderr)
+        for path, error in failed:
+            print(f" {path}: {type(error).__name__}: {error}", file=sys.stderr)
+        return 1
+    return 1 if scan_errors or changed else 0
 
 
 if __name__ == "__main__":
@@ -464,4 +2503,4 @@ if __name__ == "__main__":
     # curr_test_path = "./test_file2_copy.txt" # path to a local test file
     # reformatter(curr_test_path)
 
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
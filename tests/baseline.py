@@ -0,0 +1,211 @@
+""" The original line wrapping algorithm, kept as the oracle of the tests.
+
+This is `reformatter` as it was before the linear-time engine, except that it
+takes the text instead of a path and returns the result instead of writing a
+new file. Its output is the reference that every code path of
+`reformat_line_length` has to reproduce byte by byte (see
+`test_differential.py`). Empty input raises an IndexError here.
+"""
+
+import io
+
+
+def reformat(
+        text: str, ncol: int = None, preserve_breaks: bool = True,
+        preserve_empty_lines: bool = True, breakchars: list = ['-', '/'],
+        startchars: list = [' ', '-', '*', '>', '\t']
+        ) -> str:
+    """ Reformat `text` like the original `reformatter` did. """
+
+    infile = io.StringIO(text, newline=None) # same lines as a file
+    if preserve_empty_lines:
+        content = [line for line in infile]
+    else: # remove empty lines (whitespaces count as content!)
+        content = [line for line in infile if line[:-1]]
+    
+    # check last line for trailing new line character and add if not found
+    # this saves some special treatment of this line
+    if not content[-1][-1]=='\n':
+        content[-1] += '\n'
+    
+    # save each line's length
+    line_lengths = [len(line)-1 for line in content]
+    # find longest line (not counting trailing whitespaces)
+    max_len = max(line_lengths)
+
+    if ncol is None:
+        ncol = max_len # not really useful if `preserve_breaks` is True
+
+    for n in range(len(content)):
+        tmp_line = []
+        word = []
+        for char in content[n]:
+            if char == ' ':
+                tmp_line.append([''.join(word), ''])
+                word = []
+            elif char in breakchars:
+                tmp_line.append([''.join(word), char])
+                word = []
+            elif char == '\n' and word:
+                tmp_line.append([''.join(word), ''])
+            else:
+                word.append(char)
+        if not tmp_line: # empty line
+            tmp_line.append(['', '\n'])
+        tmp_line.append({'old_len':line_lengths[n]})
+        content[n] = tmp_line
+    # At this point each line is a list that contains for each word a sublist.
+    # Each sublist is the current word and a str that indicates the following
+    # character after the word, e.g., '-' for a hyphen or the empty str '' for
+    # a whitespace.
+    # The line list has a dictionary as its last item, which contains the key
+    # 'old_len', that describes the length of the line before any changes.
+
+    # add the length of each word to its respective list
+    for n in range(len(content)):
+        for i in range(len(content[n])-1):
+            content[n][i].append(len(content[n][i][0]))
+    # Now each word sublist is extended by the length of each word.
+
+    # mark linebreaks as either fixed or modifiable
+    for n in range(len(content)-1):
+        try:
+            # initial line is longer than new max, i.e., should be manual break
+            if (preserve_breaks and (content[n][-1]['old_len'] > ncol)):
+                content[n][-1]['manual_break'] = True
+            # check start of next line
+            elif ((content[n+1][0][1] == '\n') # empty line
+                  or (not content[n+1][0][0] and not content[n+1][0][1]
+                      and ' ' in startchars) # whitespace & it is a startchar
+                  or (not content[n+1][0][0] and content[n+1][0][1] in
+                      startchars) # lone breakchar, which is also a startchar
+                  or (preserve_breaks and (content[n+1][0][2]
+                      + content[n][-1]['old_len'] <= ncol)) # next word ...
+                      # ... would still fit on current line
+                ):
+                content[n][-1]['manual_break'] = True
+            # Separate the case of any other leading startchar from the other
+            # conditions to underline that this is where the IndexError can
+            # occur. The order of conditions is important to catch the error
+            # properly!
+            elif (content[n+1][0][0][0] in startchars):
+                content[n][-1]['manual_break'] = True
+            else:
+                content[n][-1]['manual_break'] = False
+        # If next word is '' it has no 0th index, i.e., when trying to call
+        # `content[n+1][0][0][0]` it throws an IndexError. This is only
+        # encountered if a line starts with a whitespace, but a whitespace
+        # is not found within the startchars.
+        except IndexError:
+            content[n][-1]['manual_break'] = False
+    # for completeness add a manual_break dict key for the last line as well
+    content[-1][-1]['manual_break'] = False
+    # The trailing dictionary in each line list now also contains the key
+    # 'manual_break', which indicates whether this line is supposed to be
+    # broken there or can be rearranged.
+
+    ## The following code snippet could be avoided, by not using the dict key
+    ## 'manual_break' at all, but inserting the linebreak directly instead.
+    ## As the logic of this code changed a few times, keep this for now. It
+    ## might make sense to change this later to avoid unnecessary overhead.
+    for n in range(len(content)):
+        if ((content[n][-1]['manual_break'] is True) # detect manual linebreaks
+            and not (content[n][0][1] == '\n') # but skip empty lines
+            ):
+            # insert linebreak as last word-list in the line-list
+            content[n] = content[n][:-1] + [['','\n',0]] + [content[n][-1]]
+
+    # rearrange the lines into one large stream of word-lists (w/o the dicts)
+    content = [wlist for line in content for wlist in line[:-1]]
+
+    # check for a trailing new line & add it (if necessary) for easier handling
+    # in the next stages
+    artificial_newline = False
+    if not content[-1][1] == '\n':
+        artificial_newline = True
+        content += [['', '\n', 0]]
+
+    # apply the new length by creating lines up this respective length
+    new_content = []
+    curr_line = []
+    new_length = 0
+    while True:
+        if content: # effectively: `len(content) > 0`
+            curr_word = content.pop(0)
+        else: # content is empty
+            if curr_line: # current line contains content from the last line
+                new_content.append(curr_line)
+            break
+        if not curr_word[0]: # lone whitespace or breakchar, or new line
+            if curr_word[1] == '\n': # manual new line
+                curr_line.append(curr_word[:-1])
+                new_content.append(curr_line)
+                curr_line = []
+                new_length = 0
+                continue
+            # otherwise: lone whitespace or breakchar
+            elif new_length+1 <= ncol:
+                curr_line.append(curr_word[:-1])
+                new_length += 1
+                continue
+            else: # max allowed length would be exceeded
+                curr_line.append(['', '\n'])
+                new_content.append(curr_line)
+                curr_line = [curr_word[:-1]]
+                new_length = 1
+                continue
+        else: # the word contains at least one character
+            # word is followed by a whitespace and still fits in line
+            if not curr_word[1] and new_length+curr_word[2] <= ncol:
+                curr_line.append(curr_word[:-1])
+                new_length += curr_word[2]+1
+                continue
+            # word is followed by a breakchar and still fits in line
+            elif curr_word[1] and new_length+curr_word[2]+1 <= ncol:
+                curr_line.append(curr_word[:-1])
+                new_length += curr_word[2]+1
+                continue
+            else: # line is full
+                curr_line.append(['', '\n'])
+                new_content.append(curr_line)
+                curr_line = [curr_word[:-1]]
+                new_length = curr_word[2]+1
+                continue
+    # # remove trailing new line at the end
+    # new_content[-1] = new_content[-1][:-1]
+    # -> keep the trailing new line here for easier handling in the next stage
+
+    # concatenate word-lists into one string per line
+    for n in range(len(new_content)):
+        tmp_line = ''
+        for i,w in enumerate(new_content[n]): # i: index, w: word(-list)
+            if not w[0]: # word itself is empty
+                if w[1] == '\n': # end of current line
+                    tmp_line += w[1]
+                    new_content[n] = tmp_line
+                    break # for readability only (should be superfluous)
+                elif not w[1]: # lone whitespace
+                    tmp_line += ' '
+                    continue
+                else: # lone breakchar
+                    tmp_line += w[1]
+                    continue
+            else: # word contains at least one character
+                # current word is last in line and trailed by a whitespace
+                if new_content[n][i+1][1]=='\n' and not w[1]:
+                    tmp_line += w[0]
+                    continue
+                # word is trailed by a whitespace
+                elif not w[1]:
+                    tmp_line += w[0]+' '
+                    continue
+                # word is trailed by a breakchar
+                else:
+                    tmp_line += w[0]+w[1]
+                    continue
+
+    # remove the very last newline-char, if it was added artificially
+    if artificial_newline:
+        new_content[-1] = new_content[-1][:-1]
+
+    return ''.join(new_content)
@@ -0,0 +1,71 @@
+""" Inputs and helpers shared by the tests. """
+
+import os
+import random
+import subprocess
+import sys
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))), "reformat_line_length.py")
+
+# words of different lengths, separators, startchars and all line endings
+ALPHABET = (list("abcdefgh") * 4 + list("  --//*>\t\n\n")
+            + ["xyzxyzxyzxyz", "é", "\r\n", "\r"])
+
+FIXED_TEXTS = [
+    "a",
+    "a\n",
+    "ab\n",
+    "\n",
+    "\n\n\n",
+    " \n",
+    "word",
+    "one two three four five six seven eight nine ten\n",
+    "one two three\nfour five six\n\nseven eight nine ten\n",
+    "a-b-c-d-e-f/g/h/i-j\n",
+    "lone - and / and  double  spaces \n",
+    "- item one\n- item two is longer than the first one\n* three\n",
+    "> quoted text that goes on\n> and on\n\tindented\n",
+    "xyzxyzxyzxyzxyzxyz xyzxyzxyzxyzxyz xy\n",
+    "windows\r\nline\r\nendings\r\n",
+    "old\rmac\rendings",
+    "trailing spaces   \nand more\t \n",
+    "  leading spaces\n  on each\n  line\n",
+]
+
+BREAKCHARS = [['-', '/'], [], ['-'], ['/', '*'], ['-', '/', '\t'],
+              [' ', '/']]
+STARTCHARS = [[' ', '-', '*', '>', '\t'], [], ['-'], ['*', '>'], [' ']]
+NCOLS = [None, 1, 3, 8, 20, 40]
+
+def random_text(rng: random.Random, size: int = 300) -> str:
+    """ Get a random text of up to `size` items of `ALPHABET`. """
+    text = ''.join(rng.choice(ALPHABET) for _ in range(rng.randint(0, size)))
+    if rng.random() < 0.3:
+        text += '\n'
+    return text
+
+def texts(seed: int = 0, count: int = 12) -> list:
+    """ Get `FIXED_TEXTS` and `count` reproducible random texts. """
+    rng = random.Random(seed)
+    return FIXED_TEXTS + [random_text(rng) for _ in range(count)]
+
+def write(path: str, text: str):
+    """ Write `text` to `path` with the line endings as they are. """
+    with open(path, 'w', newline='') as outfile:
+        outfile.write(text)
+
+def read(path: str) -> str:
+    """ Read `path` with the line endings as they are. """
+    with open(path, newline='') as infile:
+        return infile.read()
+
+def as_written(text: str) -> str:
+    """ Get `text` as it is written to a file in text mode. """
+    return text.replace('\n', os.linesep)
+
+def run(cwd, *args, input: str = None) -> subprocess.CompletedProcess:
+    """ Run the script with `args` in `cwd` and capture its output. """
+    return subprocess.run([sys.executable, SCRIPT, *args], cwd=str(cwd),
+                          input=input, stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE, universal_newlines=True)
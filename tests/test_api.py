@@ -0,0 +1,76 @@
+""" Tests of reformatting texts in memory.
+
+`iter_reformat` has to generate its lines while it reads the source, if
+`ncol` is given, and `reformat_batch` has to give the same result for each
+kind of source as `reformat_text` for the text itself.
+"""
+
+import io
+import itertools
+
+import pytest
+
+import reformat_line_length as rll
+from support import FIXED_TEXTS, NCOLS, texts
+
+LINE = "lorem ipsum dolor sit amet, consectetur adipiscing-elit\n"
+
+def _counted(count, consumed):
+    """ Generate `count` lines, with an empty line after every fourth one,
+    and count the lines taken in `consumed[0]`.
+    """
+    for k in range(count):
+        consumed[0] += 1
+        yield "\n" if k % 5 == 4 else LINE
+
+@pytest.mark.parametrize("preserve_breaks", [True, False])
+@pytest.mark.parametrize("wrap_mode", ['greedy', 'optimal'])
+def test_iter_reformat_is_lazy(wrap_mode, preserve_breaks):
+    consumed = [0]
+    lines = rll.iter_reformat(_counted(10000, consumed), 20,
+                              preserve_breaks=preserve_breaks,
+                              wrap_mode=wrap_mode)
+    assert consumed == [0]
+    first = list(itertools.islice(lines, 50))
+    assert len(first) == 50
+    # a few paragraphs ahead at most
+    assert consumed[0] < 50
+    rest = list(lines)
+    assert consumed == [10000]
+    assert ''.join(first + rest) == rll.reformat_text(
+        ''.join(_counted(10000, [0])), 20, preserve_breaks=preserve_breaks,
+        wrap_mode=wrap_mode)
+
+def test_iter_reformat_without_ncol_reads_all():
+    # the longest line has to be known before the first line
+    consumed = [0]
+    lines = rll.iter_reformat(_counted(100, consumed))
+    next(lines)
+    assert consumed == [100]
+
+def _sources(text, encoding='utf-8'):
+    """ Get `text` as each kind of source. """
+    data = text.encode(encoding)
+    return [text, data, bytearray(data), memoryview(data),
+            io.StringIO(text, newline=None).readlines(),
+            io.TextIOWrapper(io.BytesIO(data), encoding=encoding)]
+
+@pytest.mark.parametrize("wrap_mode", ['greedy', 'optimal'])
+@pytest.mark.parametrize("ncol", [None] + NCOLS)
+def test_reformat_batch_mixed_sources(wrap_mode, ncol):
+    params = {'ncol': ncol, 'preserve_breaks': False,
+              'wrap_mode': wrap_mode}
+    batch = FIXED_TEXTS + texts(count=4)
+    sources, expected = [], []
+    for text in batch:
+        for source in _sources(text):
+            sources.append(source)
+            expected.append(rll.reformat_text(text, **params))
+    assert rll.reformat_batch(sources, **params) == expected
+    assert rll.reformat_batch(iter([]), **params) == []
+
+def test_reformat_batch_encoding():
+    text = "Grüße aus Köln, Straße für Straße\n"
+    sources = _sources(text, 'latin-1')[1:]
+    assert (rll.reformat_batch(sources, 12, encoding='latin-1')
+            == [rll.reformat_text(text, 12)]*len(sources))
@@ -0,0 +1,25 @@
+""" Tests of the cache database (`--cache`). """
+
+import reformat_line_length as rll
+from support import write
+
+def _used(cache_path, table):
+    db = rll._cache_connect(cache_path)
+    return dict(db.execute(f"SELECT path, used FROM {table}").fetchall())
+
+def test_hit_marks_file_as_used(tmp_path):
+    cache_path = str(tmp_path / "cache.db")
+    paths = [str(tmp_path / f"{name}.txt") for name in "ab"]
+    for path in paths:
+        write(path, "some words to wrap\n")
+        assert rll._reformat_cached(path, 5, cache_path) is not None
+    db = rll._cache_connect(cache_path)
+    db.execute("UPDATE files SET used = 0")
+    db.execute("UPDATE outputs SET used = 0")
+    # only the first file is hit again, i.e., the second one is older
+    assert rll._reformat_cached(paths[0], 5, cache_path) is None
+    assert _used(cache_path, 'files')[paths[0]] > 0
+    assert _used(cache_path, 'outputs')[paths[0]] > 0
+    rll._cache_evict(cache_path, 1)
+    assert list(_used(cache_path, 'files')) == [paths[0]]
+    assert list(_used(cache_path, 'outputs')) == [paths[0]]
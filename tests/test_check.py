@@ -0,0 +1,45 @@
+""" Tests of checking files without writing them.
+
+`_check_file` has to report a change exactly if the output of `reformatter`
+differs from the file, both with and without a diff and in each
+`wrap_mode`. Each output is checked again, as reformatted files are the
+common case of a check.
+"""
+
+import itertools
+
+import pytest
+
+import reformat_line_length as rll
+from support import BREAKCHARS, NCOLS, STARTCHARS, read, texts, write
+
+COMBINATIONS = list(itertools.product([True, False], [True, False],
+                                      BREAKCHARS, STARTCHARS))
+
+@pytest.mark.parametrize("wrap_mode", ['greedy', 'optimal'])
+@pytest.mark.parametrize("combination", COMBINATIONS[::4])
+def test_check_matches_reformatter(tmp_path, combination, wrap_mode):
+    path = str(tmp_path / "input.txt")
+    output = str(tmp_path / "output.txt")
+    preserve_breaks, preserve_empty_lines, breakchars, startchars = combination
+    params = {'preserve_breaks': preserve_breaks,
+              'preserve_empty_lines': preserve_empty_lines,
+              'breakchars': breakchars, 'startchars': startchars,
+              'wrap_mode': wrap_mode}
+    for text, ncol in itertools.product(texts(count=6), NCOLS):
+        for _ in range(2): # the text, then its output
+            write(path, text)
+            try:
+                rll.reformatter(path, output=output, ncol=ncol, **params)
+            except ValueError:
+                with pytest.raises(ValueError):
+                    rll._check_file(path, ncol=ncol, **params)
+                break
+            changed = not read(output) == text
+            result = rll._check_file(path, ncol=ncol, **params)
+            assert (result is not None) == changed, (text, ncol)
+            result = rll._check_file(path, ncol=ncol, diff=True, **params)
+            assert (result is not None) == changed, (text, ncol)
+            if changed: # the diff, or a note on the line endings
+                assert result, (text, ncol)
+            text = read(output)
@@ -0,0 +1,53 @@
+""" Tests of splitting large files into chunks that are wrapped in parallel.
+
+Tiny chunk sizes split the texts at nearly every possible point, and the
+result has to be the same as the one of a single process.
+"""
+
+import random
+
+import pytest
+
+import reformat_line_length as rll
+from support import random_text, read, write
+
+def _texts(seed, count):
+    rng = random.Random(seed)
+    texts = [random_text(rng, 600) for _ in range(count)]
+    # the same texts with other line endings
+    return (texts + [text.replace('\n', '\r\n') for text in texts[:3]]
+            + [text.replace('\n', '\r') for text in texts[3:6]])
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64])
+@pytest.mark.parametrize("params", [
+    {},
+    {'ncol': 12, 'preserve_breaks': False},
+    {'ncol': 20, 'preserve_empty_lines': False, 'breakchars': []},
+    {'ncol': 8, 'startchars': [], 'wrap_mode': 'optimal'},
+])
+def test_chunks_match_serial(tmp_path, chunk_size, params):
+    path = str(tmp_path / "input.txt")
+    serial = str(tmp_path / "serial.txt")
+    chunked = str(tmp_path / "chunked.txt")
+    for text in _texts(chunk_size, 8):
+        write(path, text)
+        try:
+            rll.reformatter(path, output=serial, **params)
+        except ValueError:
+            with pytest.raises(ValueError):
+                rll.reformatter(path, output=chunked, chunk_jobs=2,
+                                chunk_size=chunk_size, **params)
+            continue
+        rll.reformatter(path, output=chunked, chunk_jobs=2,
+                        chunk_size=chunk_size, **params)
+        assert read(chunked) == read(serial), text
+
+def test_split_points_stop_without_hard_breaks():
+    # no hard breaks with -b and without empty lines, and one at the very end
+    data = b"some words to wrap\n" * 2**14 + b"\nlast\n"
+    assert rll._split_points(data, 10, 1, 'utf-8',
+                             preserve_breaks=False) == [0]
+    # the empty line within the first window, but none after it
+    data = b"some words\n" * 100 + b"\n" + b"more words\n" * 2**14
+    assert rll._split_points(data, 10, 1, 'utf-8',
+                             preserve_breaks=False) == [0, 1100]
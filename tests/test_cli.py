@@ -0,0 +1,52 @@
+""" Tests of the command line options of single files and pipes. """
+
+import pytest
+
+import reformat_line_length as rll
+from support import FIXED_TEXTS, as_written, read, run, write
+
+TEXT = "one two three four five\n"
+
+@pytest.mark.parametrize("args", [
+    ["--ncol", "8", "f.txt", "-o", "out"],
+    ["-b", "--ncol", "8", "f.txt", "-o", "out"],
+    ["--ncol", "8", "-o", "out", "f.txt"],
+    ["f.txt", "--ncol", "8", "-o", "out"],
+])
+def test_options_before_paths(tmp_path, args):
+    write(str(tmp_path / "f.txt"), TEXT)
+    process = run(tmp_path, *args)
+    assert process.returncode == 0, process.stderr
+    assert (read(str(tmp_path / "out" / "f.txt"))
+            == as_written(rll.reformat_text(
+                TEXT, ncol=8, preserve_breaks="-b" not in args)))
+
+def test_ncol_per_path(tmp_path):
+    write(str(tmp_path / "f.txt"), TEXT)
+    write(str(tmp_path / "g.txt"), TEXT)
+    process = run(tmp_path, "--ncol", "8,12", "f.txt", "g.txt", "-o", "out")
+    assert process.returncode == 0, process.stderr
+    for name, ncol in (("f.txt", 8), ("g.txt", 12)):
+        assert read(str(tmp_path / "out" / name)) == as_written(
+            rll.reformat_text(TEXT, ncol=ncol))
+
+@pytest.mark.parametrize("ncol", ["8,x", "8,12,16"])
+def test_invalid_ncol(tmp_path, ncol):
+    write(str(tmp_path / "f.txt"), TEXT)
+    write(str(tmp_path / "g.txt"), TEXT)
+    process = run(tmp_path, "--ncol", ncol, "f.txt", "g.txt", "-o", "out")
+    assert process.returncode == 2
+    assert "argument --ncol:" in process.stderr
+
+@pytest.mark.parametrize("args", [[], ["-"], ["--ncol", "8"],
+                                  ["-b", "-r", "--wrap_mode", "optimal"]])
+def test_pipe(tmp_path, args):
+    params = {'ncol': 8 if "--ncol" in args else None,
+              'preserve_breaks': "-b" not in args,
+              'preserve_empty_lines': "-r" not in args,
+              'wrap_mode': "optimal" if "optimal" in args else "greedy"}
+    # stdin keeps carriage returns on POSIX, unlike files read in text mode
+    for text in (text for text in FIXED_TEXTS if '\r' not in text):
+        process = run(tmp_path, *args, input=text)
+        assert process.returncode == 0, process.stderr
+        assert process.stdout == rll.reformat_text(text, **params), text
@@ -0,0 +1,71 @@
+""" Differential tests of all code paths against the original algorithm.
+
+For every combination of `preserve_breaks`, `preserve_empty_lines`,
+`breakchars` and `startchars`, a set of fixed and random texts is
+reformatted to several line lengths by `baseline.reformat`, and each code
+path of `reformatter` as well as `reformat_text` has to produce the same
+output byte by byte.
+"""
+
+import itertools
+import os
+
+import pytest
+
+import baseline
+import reformat_line_length as rll
+from support import (BREAKCHARS, NCOLS, STARTCHARS, as_written, read, texts,
+                     write)
+
+COMBINATIONS = list(itertools.product([True, False], [True, False],
+                                      BREAKCHARS, STARTCHARS))
+
+def _cases(preserve_breaks, preserve_empty_lines, breakchars, startchars,
+           count=12):
+    """ Generate the texts, parameters and expected results of one
+    combination, skipping texts without any lines to reformat.
+    """
+    params = {'preserve_breaks': preserve_breaks,
+              'preserve_empty_lines': preserve_empty_lines,
+              'breakchars': breakchars, 'startchars': startchars}
+    for text, ncol in itertools.product(texts(count=count), NCOLS):
+        try:
+            expected = baseline.reformat(text, ncol, **params)
+        except IndexError: # nothing to reformat, see `test_empty_input`
+            continue
+        yield text, dict(params, ncol=ncol), expected
+
+@pytest.mark.parametrize("combination", COMBINATIONS)
+def test_reformatter(tmp_path, combination):
+    path = str(tmp_path / "input.txt")
+    output = str(tmp_path / "output.txt")
+    for text, params, expected in _cases(*combination):
+        write(path, text)
+        for mode in ({}, {'stream': True}, {'stats': {}}):
+            assert rll.reformatter(path, output=output, **mode,
+                                   **params) == output
+            assert read(output) == as_written(expected), (text, mode)
+
+@pytest.mark.parametrize("combination", COMBINATIONS)
+def test_reformat_text(combination):
+    for text, params, expected in _cases(*combination):
+        assert rll.reformat_text(text, **params) == expected, text
+        assert rll.reformat_text(text.encode(), **params) == expected, text
+
+@pytest.mark.parametrize("combination", COMBINATIONS[::7])
+def test_chunk_jobs(tmp_path, combination):
+    path = str(tmp_path / "input.txt")
+    output = str(tmp_path / "output.txt")
+    for text, params, expected in _cases(*combination, count=4):
+        write(path, text)
+        rll.reformatter(path, output=output, chunk_jobs=2, chunk_size=16,
+                        **params)
+        assert read(output) == as_written(expected), text
+
+@pytest.mark.parametrize("text", ["", "\n\n"])
+def test_empty_input(tmp_path, text):
+    path = str(tmp_path / "input.txt")
+    write(path, text)
+    with pytest.raises(ValueError):
+        rll.reformatter(path, preserve_empty_lines=False)
+    assert rll.reformat_text(text, preserve_empty_lines=False) == ''
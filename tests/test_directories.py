@@ -0,0 +1,49 @@
+""" Tests of the directory mode of the command line. """
+
+import os
+
+import pytest
+
+from support import read, run, write
+
+@pytest.fixture
+def tree(tmp_path):
+    for path, text in (("a/x.txt", "from a\n"), ("b/x.txt", "from b\n"),
+                       ("d1/y.txt", "from d1\n"), ("d2/y.txt", "from d2\n"),
+                       ("d2/z.txt", "from d2\n"), ("c/d1/y.txt", "from c\n")):
+        os.makedirs(str(tmp_path / os.path.dirname(path)), exist_ok=True)
+        write(str(tmp_path / path), text)
+    return tmp_path
+
+def test_output_dir_mirrors_tree(tree):
+    process = run(tree, "d2", "--ncol", "4", "-o", "out")
+    assert process.returncode == 0, process.stderr
+    assert read(str(tree / "out" / "d2" / "y.txt")) == "from\nd2"
+    assert read(str(tree / "out" / "d2" / "z.txt")) == "from\nd2"
+
+def test_output_dir_mirrors_each_root(tree):
+    process = run(tree, "d1", "d2", "a/x.txt", "--ncol", "4", "-o", "out")
+    assert process.returncode == 0, process.stderr
+    assert read(str(tree / "out" / "d1" / "y.txt")) == "from\nd1"
+    assert read(str(tree / "out" / "d2" / "y.txt")) == "from\nd2"
+    assert read(str(tree / "out" / "x.txt")) == "from\na"
+
+@pytest.mark.parametrize("jobs", ["1", "2"])
+def test_colliding_outputs_are_failures(tree, jobs):
+    process = run(tree, "a/x.txt", "b/x.txt", "d1", "c/d1", "d2", "-o",
+                  "out", "--on_error", "skip", "-j", jobs)
+    assert process.returncode == 1
+    for path in ("a/x.txt", "b/x.txt", "d1/y.txt", "c/d1/y.txt"):
+        assert f" {path}: ValueError:" in process.stderr
+    assert os.listdir(str(tree / "out")) == ["d2"]
+    assert sorted(os.listdir(str(tree / "out" / "d2"))) == ["y.txt", "z.txt"]
+
+def test_colliding_outputs_abort(tree):
+    process = run(tree, "d1", "c/d1", "-o", "out", "--on_error", "abort")
+    assert process.returncode == 1
+    assert not os.path.exists(str(tree / "out"))
+
+def test_same_file_twice_does_not_collide(tree):
+    process = run(tree, "d1/y.txt", "d1/y.txt", "-o", "out")
+    assert process.returncode == 0, process.stderr
+    assert read(str(tree / "out" / "y.txt")) == "from d1"
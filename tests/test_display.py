@@ -0,0 +1,99 @@
+""" Tests of measuring line lengths in columns on screen.
+
+In the 'display' `width_mode`, a wide character has to take the place of
+two narrow ones. The reference thus reformats the same text in the 'chars'
+`width_mode` with each wide character replaced by two placeholder
+characters, and each code path has to give the same output.
+"""
+
+import io
+import itertools
+import random
+
+import pytest
+
+import reformat_line_length as rll
+from support import (BREAKCHARS, NCOLS, STARTCHARS, as_written, read, texts,
+                     write)
+
+WIDE = ['中', '日', '😀', 'Ｆ'] # CJK, emoji and fullwidth characters
+PLACEHOLDERS = [chr(0xE000+k) + '\uf8ff' for k in range(len(WIDE))]
+
+COMBINATIONS = list(itertools.product([True, False], [True, False],
+                                      BREAKCHARS, STARTCHARS))
+
+def _widen(text, rng):
+    """ Replace some letters of `text` with wide characters. """
+    return ''.join(rng.choice(WIDE) if char in 'gh' and rng.random() < 0.5
+                   else char for char in text)
+
+def _narrow(text):
+    for char, placeholder in zip(WIDE, PLACEHOLDERS):
+        text = text.replace(char, placeholder)
+    return text
+
+def _unnarrow(text):
+    for char, placeholder in zip(WIDE, PLACEHOLDERS):
+        text = text.replace(placeholder, char)
+    return text
+
+def _dropped(text, preserve_empty_lines):
+    """ Tell whether the last line counts as empty in one mode only, as a
+    single wide character becomes two placeholders (see `_iter_lines`).
+    """
+    last = '' if text.endswith(('\n', '\r')) else text.splitlines()[-1]
+    return not preserve_empty_lines and len(last) == 1
+
+def _cases(path, output, params, count=6):
+    """ Generate the texts with wide characters, their line lengths and the
+    expected results, written to `path` already.
+    """
+    rng = random.Random(count)
+    for text, ncol in itertools.product(texts(count=count), NCOLS):
+        text = _widen(text, rng)
+        write(path, _narrow(text))
+        try:
+            rll.reformatter(path, output=output, ncol=ncol, **params)
+        except ValueError:
+            continue
+        if _dropped(text, params['preserve_empty_lines']):
+            continue
+        expected = _unnarrow(read(output))
+        write(path, text)
+        yield text, dict(params, ncol=ncol, width_mode='display'), expected
+
+def _params(combination, wrap_mode):
+    preserve_breaks, preserve_empty_lines, breakchars, startchars = combination
+    return {'preserve_breaks': preserve_breaks,
+            'preserve_empty_lines': preserve_empty_lines,
+            'breakchars': breakchars, 'startchars': startchars,
+            'wrap_mode': wrap_mode}
+
+@pytest.mark.parametrize("wrap_mode", ['greedy', 'optimal'])
+@pytest.mark.parametrize("combination", COMBINATIONS[::4])
+def test_display(tmp_path, combination, wrap_mode):
+    path = str(tmp_path / "input.txt")
+    output = str(tmp_path / "output.txt")
+    params = _params(combination, wrap_mode)
+    for text, params, expected in _cases(path, output, params):
+        for mode in ({}, {'stream': True}):
+            rll.reformatter(path, output=output, **mode, **params)
+            assert read(output) == expected, (text, params, mode)
+        assert as_written(rll.reformat_text(text, **params)) == expected
+        outfile = io.StringIO()
+        with open(path, 'r') as infile:
+            rll._reformat_pipe(infile, outfile, **params)
+        assert as_written(outfile.getvalue()) == expected, (text, params)
+        assert ((rll._check_file(path, **params) is None)
+                == (expected == text)), (text, params)
+
+@pytest.mark.parametrize("wrap_mode", ['greedy', 'optimal'])
+@pytest.mark.parametrize("combination", COMBINATIONS[::20])
+def test_display_chunk_jobs(tmp_path, combination, wrap_mode):
+    path = str(tmp_path / "input.txt")
+    output = str(tmp_path / "output.txt")
+    params = _params(combination, wrap_mode)
+    for text, params, expected in _cases(path, output, params, count=2):
+        rll.reformatter(path, output=output, chunk_jobs=2, chunk_size=5,
+                        **params)
+        assert read(output) == expected, (text, params)
@@ -0,0 +1,23 @@
+""" Tests of the names of new files next to their input. """
+
+import os
+
+import reformat_line_length as rll
+from support import write
+
+def test_new_filename(tmp_path):
+    path = str(tmp_path / "a.tar.gz")
+    write(path, "text\n")
+    assert rll.new_filename(path) == str(tmp_path / "a.tar_1.gz")
+    write(str(tmp_path / "a.tar_1.gz"), "text\n")
+    os.mkdir(str(tmp_path / "a.tar_2.gz"))
+    assert rll.new_filename(path) == str(tmp_path / "a.tar_3.gz")
+    existing = set(os.listdir(str(tmp_path)))
+    assert rll.new_filename(path, existing) == str(tmp_path / "a.tar_3.gz")
+    assert rll.new_filename(path, existing) == str(tmp_path / "a.tar_4.gz")
+
+def test_reformatter_writes_new_files(tmp_path):
+    path = str(tmp_path / "notes")
+    write(path, "a b c\n")
+    assert rll.reformatter(path, ncol=3) == str(tmp_path / "notes_1")
+    assert rll.reformatter(path, ncol=3) == str(tmp_path / "notes_2")
@@ -0,0 +1,70 @@
+""" Tests of reformatting changed files incrementally (`--incremental`).
+
+After an edit, `_reformat_incremental` has to write the same output as
+`reformatter`, while only the blocks around the edit are wrapped again.
+"""
+
+import random
+
+import pytest
+
+import reformat_line_length as rll
+from support import read, write
+
+WORDS = "lorem ipsum dolor sit amet consectetur adipiscing-elit sed do".split()
+
+def _paragraphs(rng, count, max_lines=5):
+    return ['\n'.join(' '.join(rng.choice(WORDS)
+                               for _ in range(rng.randint(3, 12)))
+                      for _ in range(rng.randint(1, max_lines)))
+            for _ in range(count)]
+
+def _check(tmp_path, text, params, max_wrapped=None):
+    """ Reformat `text` incrementally and with `reformatter`, compare both
+    and return the stats of the incremental run.
+    """
+    path = str(tmp_path / "input.txt")
+    write(path, text)
+    stats = {}
+    rll._reformat_incremental(path, cache_path=str(tmp_path / "cache.db"),
+                              output=str(tmp_path / "incremental.txt"),
+                              stats=stats, **params)
+    rll.reformatter(path, output=str(tmp_path / "full.txt"), **params)
+    assert (read(str(tmp_path / "incremental.txt"))
+            == read(str(tmp_path / "full.txt")))
+    if max_wrapped is not None:
+        assert stats['blocks_wrapped'] <= max_wrapped, stats
+    return stats
+
+@pytest.mark.parametrize("preserve_breaks", [True, False])
+@pytest.mark.parametrize("wrap_mode", ['greedy', 'optimal'])
+def test_edit_one_paragraph(tmp_path, wrap_mode, preserve_breaks):
+    rng = random.Random(1)
+    params = {'ncol': 30, 'preserve_breaks': preserve_breaks,
+              'wrap_mode': wrap_mode}
+    paragraphs = _paragraphs(rng, 200)
+    stats = _check(tmp_path, '\n\n'.join(paragraphs) + '\n', params)
+    assert stats['blocks'] > 4
+    assert stats['blocks_wrapped'] == stats['blocks']
+    _check(tmp_path, '\n\n'.join(paragraphs) + '\n', params, max_wrapped=0)
+    for _ in range(10):
+        k = rng.randrange(len(paragraphs))
+        paragraphs[k] = _paragraphs(rng, 1)[0]
+        # the edited block, and the next one if a block boundary moved
+        _check(tmp_path, '\n\n'.join(paragraphs) + '\n', params,
+               max_wrapped=2)
+
+@pytest.mark.parametrize("wrap_mode", ['greedy', 'optimal'])
+def test_last_block(tmp_path, wrap_mode):
+    rng = random.Random(2)
+    params = {'ncol': 30, 'wrap_mode': wrap_mode}
+    # one line each, such that each block ends at the end of a paragraph
+    paragraphs = _paragraphs(rng, 60, max_lines=1)
+    text = '\n\n'.join(paragraphs)
+    _check(tmp_path, text + '\n', params)
+    # the file cut after each paragraph, i.e., also after each cached block,
+    # which is the last block now and has no hard break at its end
+    for end in range(len(paragraphs), 0, -1):
+        _check(tmp_path, '\n\n'.join(paragraphs[:end]) + '\n', params)
+    # the former last block gets a hard break at its end
+    _check(tmp_path, text + '\n\nappended\n', params, max_wrapped=2)
@@ -0,0 +1,57 @@
+""" Tests of the line breaks with the least raggedness.
+
+`_optimal_breaks` has to reach the least cost that a plain quadratic search
+over all line starts finds, also with items of zero width and overfull lines.
+"""
+
+import random
+
+import pytest
+
+import reformat_line_length as rll
+
+def _line_cost(widths, gaps, ncol, start, end):
+    """ Cost of a line with the items from start to end (exclusive). """
+    n = len(widths)
+    width = sum(widths[start:end]) + sum(gaps[start:end-1])
+    if width > ncol:
+        return (ncol+1)**2 * (n+1) * (width-ncol)**2
+    if end == n: # the last line is free, as long as it fits
+        return 0
+    return (ncol-width)**2
+
+def _least_cost(widths, gaps, ncol):
+    n = len(widths)
+    best = [0]
+    for end in range(1, n+1):
+        best.append(min(
+            best[start] + _line_cost(widths, gaps, ncol, start, end)
+            for start in range(end)))
+    return best[n]
+
+def _cost(breaks, widths, gaps, ncol):
+    starts = [0] + breaks[:-1]
+    return sum(_line_cost(widths, gaps, ncol, start, end)
+               for start, end in zip(starts, breaks))
+
+@pytest.mark.parametrize("widths, gaps, ncol, breaks", [
+    ([0, 15], [0, 0], 7, [2]),
+    ([3, 3, 3], [1, 1, 1], 7, [2, 3]),
+    ([8], [1], 3, [1]),
+])
+def test_examples(widths, gaps, ncol, breaks):
+    assert rll._optimal_breaks(widths, gaps, ncol) == breaks
+
+@pytest.mark.parametrize("seed", range(4))
+def test_least_cost(seed):
+    rng = random.Random(seed)
+    for _ in range(2000):
+        n = rng.randint(1, 12)
+        ncol = rng.randint(1, 12)
+        widths = [rng.choice([0, 0, 1, 2, 3, 5, 8, 15]) for _ in range(n)]
+        gaps = [rng.choice([0, 1]) for _ in range(n)]
+        breaks = rll._optimal_breaks(widths, gaps, ncol)
+        assert breaks[-1] == n
+        assert breaks == sorted(set(breaks))
+        assert (_cost(breaks, widths, gaps, ncol)
+                == _least_cost(widths, gaps, ncol)), (widths, gaps, ncol)
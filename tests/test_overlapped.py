@@ -0,0 +1,113 @@
+""" Tests of reading and writing files on threads while the next one wraps.
+
+`_reformat_overlapped` has to give the same results in the same order and
+write the same files byte by byte as reformatting the files one after the
+other, also with tight memory limits and when files are given twice or are
+the outputs of earlier ones.
+"""
+
+import os
+import time
+
+import pytest
+
+import reformat_line_length as rll
+from support import texts, write
+
+def _inputs(seed=0):
+    """ Get the names and texts of the input files, incl. an empty one. """
+    inputs = texts(seed, count=8)
+    inputs = (inputs + [text.replace('\n', '\r\n') for text in inputs[:4]]
+              + [text.replace('\n', '\r') for text in inputs[4:8]])
+    inputs.insert(len(inputs)//2, '') # nothing to reformat
+    return [(f"f{k}.txt", text) for k, text in enumerate(inputs)]
+
+def _snapshot(root):
+    """ Get the contents of all files below `root` by their relative path. """
+    files = {}
+    for directory, _, names in os.walk(root):
+        for name in names:
+            path = os.path.join(directory, name)
+            with open(path, 'rb') as infile:
+                files[os.path.relpath(path, root)] = infile.read()
+    return files
+
+def _run(root, inputs, order, output, reformat):
+    """ Write the inputs below `root`, reformat the files with the given
+    indices in `order` and return the results and all files afterwards.
+    """
+    os.makedirs(os.path.join(root, "out"))
+    for name, text in inputs:
+        write(os.path.join(root, name), text)
+    files = []
+    for position, k in enumerate(order):
+        path = os.path.join(root, inputs[k][0])
+        target = {'none': None, 'in_place': path,
+                  'dir': os.path.join(root, "out", inputs[k][0])}[output]
+        if output == 'dir' and k == 3: # fails to be written
+            target = os.path.join(root, "missing", inputs[k][0])
+        files.append((path, [None, 4, 9][position % 3], target))
+    results = [(os.path.relpath(path, root),
+                None if result is None else os.path.relpath(result, root),
+                None if error is None else type(error))
+               for path, result, error in reformat(files)]
+    return results, _snapshot(root)
+
+@pytest.mark.parametrize("io_bytes", [2**26, 64, 1])
+@pytest.mark.parametrize("io_threads", [1, 3])
+@pytest.mark.parametrize("output", ['none', 'in_place', 'dir'])
+@pytest.mark.parametrize("stop_on_error", [False, True])
+@pytest.mark.parametrize("twice", [False, True])
+def test_overlapped_matches_serial(tmp_path, io_bytes, io_threads, output,
+                                   stop_on_error, twice):
+    inputs = _inputs()
+    order = list(range(len(inputs)))
+    if twice: # each file right after itself, and all once more at the end
+        order = [k for k in order for _ in range(2)] + order
+    params = {'stop_on_error': stop_on_error, 'wrap_mode': 'greedy'}
+
+    def serial(files):
+        return rll._reformat_files(files, io_threads=0, **params)
+
+    def overlapped(files):
+        return rll._reformat_overlapped(files, io_threads, io_bytes,
+                                        **params)
+
+    expected = _run(str(tmp_path / "serial"), inputs, order, output, serial)
+    assert any(error for *_, error in expected[0])
+    assert _run(str(tmp_path / "overlapped"), inputs, order, output,
+                overlapped) == expected
+
+def test_reformat_files_overlaps(tmp_path, monkeypatch):
+    calls = []
+    overlapped = rll._reformat_overlapped
+    def spy(*args, **kwargs):
+        calls.append(args)
+        return overlapped(*args, **kwargs)
+    monkeypatch.setattr(rll, '_reformat_overlapped', spy)
+    inputs = _inputs()
+    order = range(len(inputs))
+    expected = _run(str(tmp_path / "serial"), inputs, order, 'dir',
+                    lambda files: rll._reformat_files(files, io_threads=0))
+    assert not calls
+    assert _run(str(tmp_path / "overlapped"), inputs, order, 'dir',
+                lambda files: rll._reformat_files(files, io_threads=2)
+                ) == expected
+    assert calls
+
+def test_outputs_to_same_path_in_order(tmp_path, monkeypatch):
+    written = set()
+    write_new_file = rll._write_new_file
+    def slow_first(path, lines, output, *args):
+        # a later write to the same output would overtake an unordered one
+        if output not in written:
+            written.add(output)
+            time.sleep(0.05)
+        return write_new_file(path, lines, output, *args)
+    monkeypatch.setattr(rll, '_write_new_file', slow_first)
+    inputs = _inputs()[7:10] # long enough to change with ncol
+    order = [0, 0, 1, 1, 2, 2]
+    expected = _run(str(tmp_path / "serial"), inputs, order, 'dir',
+                    lambda files: rll._reformat_files(files, io_threads=0))
+    assert _run(str(tmp_path / "overlapped"), inputs, order, 'dir',
+                lambda files: rll._reformat_overlapped(files, 3)) == expected
@@ -0,0 +1,63 @@
+""" Tests of the reformat server on a Unix domain socket.
+
+The server has to replace the socket file of a server that is gone, but
+never remove any other file at the socket path. Only the current user may
+connect to it.
+"""
+
+import json
+import os
+import socket
+import stat
+import threading
+import time
+
+import pytest
+
+import reformat_line_length as rll
+from support import read, write
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, 'AF_UNIX'),
+                                reason="needs Unix domain sockets")
+
+def test_regular_file_is_kept(tmp_path):
+    path = str(tmp_path / "server.sock")
+    write(path, "not a socket\n")
+    with pytest.raises(FileExistsError):
+        rll._serve(path, idle_timeout=0.1, poll_interval=0.05)
+    assert read(path) == "not a socket\n"
+
+def test_stale_socket_is_replaced(tmp_path):
+    path = str(tmp_path / "server.sock")
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(path)
+    stale.close() # leaves the socket file behind
+    rll._serve(path, idle_timeout=0.1, poll_interval=0.05)
+    assert not os.path.exists(path)
+
+def _client(path, results):
+    """ Note the mode of the socket file and stop the server again. """
+    while not os.path.exists(path):
+        time.sleep(0.01)
+    results['mode'] = stat.S_IMODE(os.stat(path).st_mode)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(path)
+        stream = client.makefile('rwb')
+        for request in ({'text': "a b c\n", 'ncol': 3}, {'op': 'shutdown'}):
+            stream.write(json.dumps(request).encode() + b'\n')
+            stream.flush()
+            results.setdefault('responses', []).append(
+                json.loads(stream.readline()))
+
+def test_socket_is_private(tmp_path):
+    path = str(tmp_path / "server.sock")
+    results = {}
+    client = threading.Thread(target=_client, args=(path, results))
+    client.start()
+    rll._serve(path, idle_timeout=10.0, poll_interval=0.05)
+    client.join()
+    assert results['mode'] & 0o077 == 0
+    assert results['responses'][0] == {
+        'ok': True, 'text': rll.reformat_text("a b c\n", ncol=3)}
+    assert results['responses'][1] == {'ok': True}
+    assert not os.path.exists(path)
@@ -0,0 +1,40 @@
+""" Tests of the statistics of a run (`--stats`). """
+
+import json
+
+import reformat_line_length as rll
+from support import run, write
+
+def test_stats_counts(tmp_path):
+    path = str(tmp_path / "input.txt")
+    write(path, "one two three\nfour\n")
+    stats = {}
+    rll.reformatter(path, 8, output=str(tmp_path / "output.txt"),
+                    stats=stats)
+    assert stats['lines'] == 2
+    assert stats['tokens'] == 4
+    assert set(stats['time']) == {'read', 'tokenize', 'breaks', 'wrap',
+                                  'write'}
+    # the peak of the process, not of this file (see `_peak_memory`)
+    assert 'peak_memory' not in stats
+
+def test_peak_memory_only_in_total(tmp_path):
+    write(str(tmp_path / "f.txt"), "one two three\nfour\n")
+    write(str(tmp_path / "g.txt"), "five six seven\n")
+    process = run(tmp_path, "--ncol", "8", "f.txt", "g.txt", "-o", "out",
+                  "--stats", "--stats_format", "json")
+    assert process.returncode == 0, process.stderr
+    report = json.loads(process.stderr)
+    assert len(report['files']) == 2
+    assert not any('peak_memory' in stats for stats in report['files'])
+    assert report['total']['files'] == 2
+    assert 'peak_memory' in report['total']
+
+def test_format_without_peak_memory():
+    # the peak memory is None without the `resource` module
+    stats = {'time': {'total': 1.0}}
+    total = rll._aggregate_stats([stats, stats])
+    assert total.pop('files') == 2
+    total['peak_memory'] = None
+    assert (rll._format_stats("total", total)
+            == "total: 2.000 s, peak memory n/a")